@@ -0,0 +1,100 @@
+"""Compare coreset and mini-batch clustering with the exact KMeans fit.
+
+    python benchmarks/bench_clustering.py --customers 10000000 --k 4
+
+A synthetic RFM table is normalized chunk by chunk into a memory-mapped
+``.npy`` file. The exact KMeans runs on the array loaded in memory; the
+streamed methods read the memory map in chunks. For each method the script
+prints the wall time, the peak traced allocation, the inertia gap to the exact
+fit and the largest difference of a normalized cluster mean.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retail_segmentation import clustering  # noqa: E402
+from retail_segmentation.rfm import RFM_COLUMNS  # noqa: E402
+
+# Typical (Recency, Frequency, MonetaryValue) of four customer groups.
+PROFILES = np.array([[200, 5, 80], [120, 120, 2500], [30, 30, 500], [15, 700, 15000]], dtype='float64')
+
+
+def synthetic_rfm(customers, seed=0):
+    """Log-normal RFM values around :data:`PROFILES`."""
+    rng = np.random.default_rng(seed)
+    group = rng.integers(0, len(PROFILES), customers)
+    values = np.exp(np.log(PROFILES[group]) + rng.normal(0, 0.5, (customers, 3)))
+    return pd.DataFrame(np.ceil(values), columns=RFM_COLUMNS)
+
+
+def compare(X, approximate, exact, columns=RFM_COLUMNS):
+    """Quality cost of ``approximate`` against an exact KMeans fit on the same ``X``.
+
+    Clusters are paired by centroid distance. Returns ``(inertia, clusters)``:
+    the inertia of both with the relative gap, and per exact cluster its size
+    and (normalized) mean next to those of the paired approximate cluster.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    centroids = np.asarray(exact.cluster_centers_)
+    _, exact_inertia, exact_sizes, exact_sums = clustering.assign(X, centroids)
+    _, approx_inertia, approx_sizes, approx_sums = clustering.assign(X, approximate.cluster_centers_)
+    cost = ((centroids[:, None, :] - np.asarray(approximate.cluster_centers_)[None, :, :]) ** 2).sum(axis=2)
+    _, pair = linear_sum_assignment(cost)
+
+    inertia = pd.Series({'exact': exact_inertia, 'approximate': approx_inertia,
+                         'gap': approx_inertia / exact_inertia - 1})
+    clusters = pd.DataFrame({'size': exact_sizes, 'approximate_size': approx_sizes[pair]})
+    exact_means = exact_sums / np.maximum(exact_sizes, 1)[:, None]
+    approx_means = approx_sums[pair] / np.maximum(approx_sizes[pair], 1)[:, None]
+    for d, col in enumerate(columns):
+        clusters[col] = exact_means[:, d]
+        clusters['approximate_' + col] = approx_means[:, d]
+    clusters.index.name = 'cluster'
+    return inertia, clusters
+
+
+def measured(fn, *args):
+    """``(result, seconds, peak traced MB)``; timed and traced in separate runs, as tracing slows numpy down."""
+    start = time.perf_counter()
+    out = fn(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--customers', type=int, default=2000000)
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--methods', nargs='+', default=['coreset', 'minibatch'])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _, X = clustering.scale_to_memmap(synthetic_rfm(args.customers), os.path.join(tmp, 'data_norm.npy'))
+        exact, t_exact, m_exact = measured(clustering.fit_kmeans, np.array(X), args.k)
+        print('customers={} k={}'.format(args.customers, args.k))
+        print('{:<10} {:>9} {:>10} {:>12} {:>10}'.format('', 'time', 'peak MB', 'inertia gap', 'mean diff'))
+        print('{:<10} {:8.2f}s {:10.1f} {:>12} {:>10}'.format('exact', t_exact, m_exact, '-', '-'))
+        for method in args.methods:
+            model, elapsed, peak = measured(clustering.fit_streamed, X, args.k, method)
+            inertia, clusters = compare(X, model, exact)
+            diff = max((clusters[col] - clusters['approximate_' + col]).abs().max() for col in RFM_COLUMNS)
+            print('{:<10} {:8.2f}s {:10.1f} {:>12.4%} {:10.4f}'.format(method, elapsed, peak, inertia['gap'], diff))
+        del X
+
+
+if __name__ == '__main__':
+    main()
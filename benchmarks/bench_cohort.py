@@ -0,0 +1,68 @@
+"""Benchmark the month-number cohort engine against the notebook implementation.
+
+    python benchmarks/bench_cohort.py --rows 2000000
+
+The notebook approximates CohortIndex as days/30 while the engine uses exact
+calendar months, so the tables differ; the script only checks that every
+customer lands in exactly one cohort.
+"""
+
+import argparse
+import datetime as dt
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retail_segmentation import cohort  # noqa: E402
+
+
+def legacy_cohort(df):
+    """The cohort section of the original notebook, unchanged."""
+    cohort_data = df[['InvoiceNo', 'InvoiceDate', 'CustomerID']]
+    cohort_data.InvoiceDate = pd.to_datetime(cohort_data.InvoiceDate).apply(lambda x: dt.datetime(x.year, x.month, x.day))
+    grouping = cohort_data.groupby('CustomerID', as_index=False)['InvoiceDate'].min()
+    grouping.columns = ['CustomerID', 'CohortMonth']
+    grouping['CohortMonth'] = grouping['CohortMonth'].apply(lambda x: dt.datetime(x.year, x.month, 1))
+    cohort_data = cohort_data.merge(grouping, on='CustomerID', how='left')
+    cohort_data['CohortIndex'] = pd.Series((cohort_data.InvoiceDate - cohort_data.CohortMonth) / 30).dt.days.astype('int')
+    grouping = cohort_data.groupby(['CohortMonth', 'CohortIndex'], as_index=False).agg({'CustomerID': 'nunique'})
+    return grouping.pivot_table(columns='CohortIndex', index='CohortMonth')
+
+
+def synthetic_transactions(rows, customers, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'InvoiceNo': rng.integers(536365, 536365 + rows // 20 + 1, rows).astype(str),
+        'InvoiceDate': pd.Timestamp('2010-12-01') + pd.to_timedelta(rng.integers(0, 374 * 24 * 60, rows), unit='min'),
+        'CustomerID': ((customers * rng.random(rows) ** 2).astype(np.int64) + 12346).astype('float64'),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--customers', type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    df = synthetic_transactions(args.rows, args.customers)
+    start = time.perf_counter()
+    expected = legacy_cohort(df)
+    t_legacy = time.perf_counter() - start
+    start = time.perf_counter()
+    cohort_counts, _ = cohort.compute(df)
+    t_engine = time.perf_counter() - start
+
+    assert cohort_counts[0].sum() == df.CustomerID.nunique()
+    assert len(cohort_counts) == len(expected)
+    print('rows={} cohorts={}'.format(len(df), len(cohort_counts)))
+    print('legacy  {:8.3f}s'.format(t_legacy))
+    print('engine  {:8.3f}s  ({:.1f}x)'.format(t_engine, t_legacy / t_engine))
+
+
+if __name__ == '__main__':
+    main()
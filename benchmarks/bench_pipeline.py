@@ -0,0 +1,83 @@
+"""End-to-end scaling benchmark on synthetic Online Retail data.
+
+    python benchmarks/bench_pipeline.py --rows 1000000 10000000 100000000 --out bench.json
+
+For every size a synthetic table is generated once (cached in --data-dir) and
+each stage is timed and memory-profiled with
+:class:`~retail_segmentation.instrument.RunReport`: wall and CPU time, peak RSS
+and peak traced allocations (tracemalloc, which numpy and pandas report to;
+Arrow buffers of the load stage are not traced). The JSON output is the
+regression baseline for later changes.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retail_segmentation import pipeline, synthetic  # noqa: E402
+from retail_segmentation.instrument import RunReport  # noqa: E402
+
+
+STAGES = ['load', 'cleaning', 'dedup', 'cohort', 'rfm', 'scaling', 'kmeans']
+
+
+def run(path, k=4):
+    report = RunReport(tracemalloc_stages=STAGES)
+    with report.stage('load') as s:
+        df = pipeline.load(path)
+        s['rows_out'] = len(df)
+    with report.stage('cleaning', len(df)) as s:
+        df = pipeline.prepare(df)
+        s['rows_out'] = len(df)
+    with report.stage('dedup', len(df)) as s:
+        df = pipeline.dedup(df)
+        s['rows_out'] = len(df)
+    with report.stage('cohort', len(df)) as s:
+        cohort_data, cohort_counts, _ = pipeline.cohort(df)
+        s['rows_out'] = len(cohort_counts)
+    with report.stage('rfm', len(cohort_data)) as s:
+        data = pipeline.rfm(cohort_data)
+        s['rows_out'] = len(data)
+    with report.stage('scaling', len(data)) as s:
+        _, data_norm = pipeline.scale(data)
+        s['rows_out'] = len(data_norm)
+    with report.stage('kmeans', len(data_norm)) as s:
+        pipeline.cluster(data_norm, k)
+        s['rows_out'] = len(data_norm)
+    return report, len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000])
+    parser.add_argument('--data-dir', default='bench_data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    # Unused on purpose: importing scikit-learn here keeps its import time out
+    # of the normalize and cluster stage timings.
+    import sklearn.cluster  # noqa: F401
+    import sklearn.preprocessing  # noqa: F401
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = []
+    for rows in args.rows:
+        path = os.path.join(args.data_dir, 'retail-{}-s{}.parquet'.format(rows, args.seed))
+        if not os.path.exists(path):
+            synthetic.write(path, rows, seed=args.seed)
+        report, customers = run(path)
+        results.append({'rows': rows, 'customers': customers, 'stages': report.records})
+        print('rows={} customers={}'.format(rows, customers))
+        print(report)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Compare sketched R/F/M quartiles with the exact pd.qcut scoring.
+
+    python benchmarks/bench_quantiles.py --customers 1000000 --partitions 16 --k 200 1000 4000
+
+A synthetic customer table is scored once with the exact quartiles and once
+per sketch size k, with the customers split into partitions that are sketched
+separately and merged. For every k the script prints the worst rank error of
+the cut points, the share of R/F/M codes that agree with qcut, the time spent
+sketching and merging, and the total time with scoring against the exact path.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retail_segmentation import rfm, sketch  # noqa: E402
+
+
+def synthetic_customers(customers, seed=0):
+    """Recency in days, a long-tailed Frequency and a lognormal MonetaryValue."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'CustomerID': np.arange(12346, 12346 + customers, dtype='float64'),
+        'Recency': rng.integers(1, 366, customers),
+        'Frequency': rng.geometric(0.03, customers),
+        'MonetaryValue': np.round(rng.lognormal(6.0, 1.3, customers), 2),
+    })
+
+
+def rank_error(values, cut, quantiles):
+    """Worst distance between the target quantiles and the ranks the cut points fall between."""
+    ordered = np.sort(values)
+    lo = np.searchsorted(ordered, cut, side='left') / len(ordered)
+    hi = np.searchsorted(ordered, cut, side='right') / len(ordered)
+    return np.maximum(0, np.maximum(lo - quantiles, quantiles - hi)).max()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--customers', type=int, default=1000000)
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--k', type=int, nargs='+', default=[200, 1000, 4000])
+    args = parser.parse_args(argv)
+
+    data = synthetic_customers(args.customers)
+    start = time.perf_counter()
+    exact = rfm.score(data.copy())
+    t_exact = time.perf_counter() - start
+    print('customers={} partitions={}'.format(args.customers, args.partitions))
+    print('{:<8} {:>10} {:>8} {:>8} {:>8} {:>9} {:>9}'.format('', 'rank err', 'R agree', 'F agree', 'M agree',
+                                                              'sketch', 'total'))
+    print('{:<8} {:>10} {:>8} {:>8} {:>8} {:>9} {:8.3f}s'.format('exact', '-', '-', '-', '-', '-', t_exact))
+
+    quantiles = np.array(sketch.QUARTILES)
+    shards = np.array_split(np.arange(len(data)), args.partitions)
+    for k in args.k:
+        start = time.perf_counter()
+        parts = [data.iloc[rows] for rows in shards]
+        cut = sketch.cut_points(sketch.merge(sketch.rfm_sketches(part, k, seed=i) for i, part in enumerate(parts)))
+        t_sketch = time.perf_counter() - start
+        scored = pd.concat([rfm.score(part.copy(), cut_points=cut) for part in parts])
+        elapsed = time.perf_counter() - start
+        error = max(rank_error(data[col].to_numpy(), cut[col], quantiles) for col in rfm.RFM_COLUMNS)
+        agree = [(scored[c].to_numpy() == exact[c].to_numpy()).mean() for c in 'RFM']
+        print('{:<8} {:>10.4%} {:>8.2%} {:>8.2%} {:>8.2%} {:8.3f}s {:8.3f}s'.format(
+            'k={}'.format(k), error, *agree, t_sketch, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Latency of segment scoring, in process and through the HTTP service.
+
+    python benchmarks/bench_scoring.py --requests 2000
+
+Fits the scaler and KMeans on synthetic RFM rows, checks that the exported
+artifact assigns the same clusters as scikit-learn, and prints p50/p99
+latencies for single rows and 10k-row batches.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retail_segmentation import pipeline  # noqa: E402
+from retail_segmentation.serving import SegmentModel, serve  # noqa: E402
+
+
+def synthetic_rfm(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Recency': rng.integers(1, 365, n),
+                         'Frequency': np.ceil(rng.lognormal(3, 1.2, n)),
+                         'MonetaryValue': np.round(rng.lognormal(6, 1.3, n), 2)})
+
+
+def percentiles(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return np.percentile(times, 50) * 1e3, np.percentile(times, 99) * 1e3
+
+
+def post(url, rows):
+    body = json.dumps({'rows': rows}).encode()
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())['clusters']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--customers', type=int, default=100000)
+    parser.add_argument('-k', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    data = synthetic_rfm(args.customers)
+    scaler, data_norm = pipeline.scale(data)
+    kmeans = pipeline.cluster(data_norm, args.k)
+    model = SegmentModel.from_fitted(scaler, kmeans)
+    assert (model.predict(data) == kmeans.predict(data_norm)).all()
+
+    single = data.to_numpy()[:1]
+    batch = data.to_numpy()[:10000]
+    print('{:<22} {:>10} {:>10}'.format('', 'p50 ms', 'p99 ms'))
+    print('{:<22} {:10.3f} {:10.3f}'.format('predict 1 row', *percentiles(lambda: model.predict(single), args.requests)))
+    print('{:<22} {:10.3f} {:10.3f}'.format('predict 10k rows', *percentiles(lambda: model.predict(batch), args.requests // 10)))
+
+    server = serve(model, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/predict'.format(server.server_address[1])
+    single, batch = single.tolist(), batch.tolist()
+    assert post(url, batch) == model.predict(np.array(batch)).tolist()
+    print('{:<22} {:10.3f} {:10.3f}'.format('http 1 row', *percentiles(lambda: post(url, single), args.requests)))
+    print('{:<22} {:10.3f} {:10.3f}'.format('http 10k rows', *percentiles(lambda: post(url, batch), args.requests // 10)))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""Customer segmentation pipeline for the Online Retail dataset.
+
+The stages are in :mod:`retail_segmentation.pipeline`; the submodules hold the
+engines behind them (e.g. :mod:`retail_segmentation.rfm`).
+"""
+
+from .ingest import COLUMNS, STAGE_COLUMNS, load_transactions
+from .pipeline import run
+
+__all__ = ['COLUMNS', 'STAGE_COLUMNS', 'load_transactions', 'run']
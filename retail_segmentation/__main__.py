@@ -0,0 +1,164 @@
+"""Command line entry point: ``python -m retail_segmentation Online_Retail.xlsx``."""
+
+import argparse
+import os
+import sys
+
+from . import pipeline
+from .ingest import DEFAULT_CACHE_DIR
+from .instrument import RunReport
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='retail_segmentation',
+        description='RFM segmentation and K-means clustering of the Online Retail transactions.')
+    parser.add_argument('source', help='Online_Retail.xlsx, a CSV export or a cached Parquet file')
+    parser.add_argument('-o', '--output', default='output',
+                        help='directory for the result tables (default: %(default)s)')
+    parser.add_argument('-k', type=int, nargs='+', default=list(pipeline.K_VALUES),
+                        help='number of clusters to fit (default: %(default)s)')
+    parser.add_argument('--window-days', type=int, default=pipeline.WINDOW_DAYS,
+                        help='length of the RFM window in days (default: %(default)s)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='columnar ingestion cache (default: %(default)s)')
+    parser.add_argument('--net-cancellations', action='store_true',
+                        help='match cancellations to their purchases and compute RFM on the net amounts')
+    parser.add_argument('--quantiles', choices=['exact', 'sketch'], default='exact',
+                        help='R/F/M quartiles from pd.qcut or from a mergeable quantile sketch (default: %(default)s)')
+    parser.add_argument('--by-country', action='store_true',
+                        help='also segment every Country separately, on a process pool of --jobs workers')
+    parser.add_argument('--kmeans', choices=['exact', 'coreset', 'minibatch'], default='exact',
+                        help='full KMeans, or centroids from a weighted coreset or mini-batches (default: %(default)s)')
+    parser.add_argument('--snapshots', metavar='MONTHS', type=int, default=None,
+                        help='also write the RFM values, scores and clusters of every customer as of each of the '
+                             'last MONTHS month-ends to <output>/rfm_snapshots.csv')
+    parser.add_argument('--basket', metavar='COMPONENTS', type=int, default=None,
+                        help='also cluster on this many TF-IDF/SVD components of the sparse '
+                             'customer x StockCode matrix')
+    parser.add_argument('--basket-weight', type=float, default=1.0,
+                        help='variance of the basket components relative to the RFM columns (default: %(default)s)')
+    parser.add_argument('--state-dir', metavar='DIR',
+                        help='update the segments of the previous run kept in DIR, keeping the cluster ids, '
+                             'and refit KMeans only on drift')
+    parser.add_argument('--rfm-state', metavar='PATH',
+                        help='treat the source as the next batch: fold it into the RFM state kept in PATH (.npz) '
+                             'and segment every customer of its window')
+    parser.add_argument('--cohort-state', metavar='PATH',
+                        help='treat the source as the next batch: fold it into the cohort state kept in PATH (.npz) '
+                             'and write the retention of the whole history')
+    parser.add_argument('--dedup-index', metavar='PATH',
+                        help='also drop the lines seen by earlier runs, whose fingerprints are kept in PATH (.npz)')
+    parser.add_argument('--elbow', action='store_true', help='also run the elbow sweep over k = 1..24')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='parallel fits in the elbow sweep, markets in --by-country and figures in --report '
+                             '(default: all cores)')
+    parser.add_argument('--score-sample', type=int, default=None,
+                        help='also report silhouette and Davies-Bouldin scores on this many sampled customers')
+    parser.add_argument('--stage-cache', metavar='DIR',
+                        help='keep stage results in DIR and skip every stage whose inputs and parameters are unchanged')
+    parser.add_argument('--stage-cache-mb', type=float, default=pipeline.stagecache.MAX_MB,
+                        help='size limit of --stage-cache; least recently used results are evicted '
+                             '(default: %(default)s)')
+    parser.add_argument('--model-dir', default=None, help='directory to cache fitted KMeans models in')
+    parser.add_argument('--report', action='store_true', help='render the figures to <output>/figures')
+    parser.add_argument('--report-format', nargs='+', default=['png'],
+                        help='figure formats: png, svg, pdf, ... or html for one report.html (default: png)')
+    parser.add_argument('--run-report', metavar='PATH',
+                        help='write per-stage timings, peak RSS and row counts as JSON (or CSV for a .csv path)')
+    parser.add_argument('--cprofile', metavar='STAGE', nargs='+', default=[],
+                        help='capture cProfile stats of these stages (load prep dedup classify net cohort rfm '
+                             'normalize elbow cluster basket countries snapshots)')
+    parser.add_argument('--tracemalloc', metavar='STAGE', nargs='+', default=[],
+                        help='capture tracemalloc allocation sites of these stages')
+    parser.add_argument('--profile-dir', default='profiles', help='where captures are written (default: %(default)s)')
+    parser.add_argument('--memory-budget', metavar='MB', type=float, default=None,
+                        help='memory-budget mode: compact dtypes, and flag stages whose peak RSS exceeds MB')
+    parser.add_argument('--validate', action='store_true',
+                        help='profile the data first, write <output>/profile.csv and stop if it fails the '
+                             'quality checks')
+    parser.add_argument('--export', metavar='PATH', help='save the scaler and centroids as a scoring artifact (.npz)')
+    parser.add_argument('--export-k', type=int, default=4, help='k of the exported model (default: %(default)s)')
+    return parser
+
+
+def write_tables(result, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    result['rfm'].to_csv(os.path.join(out_dir, 'customers.csv'), index=False)
+    result['retention'].to_csv(os.path.join(out_dir, 'retention.csv'))
+    for k, summary in result['summaries'].items():
+        summary.to_csv(os.path.join(out_dir, 'summary_k{}.csv'.format(k)))
+    if 'sweep' in result:
+        result['sweep'].to_csv(os.path.join(out_dir, 'sweep.csv'))
+    if 'snapshots' in result:
+        result['snapshots'].to_csv(os.path.join(out_dir, 'rfm_snapshots.csv'), index=False)
+    for k, drift in result.get('drift', {}).items():
+        if drift is not None:
+            drift.to_csv(os.path.join(out_dir, 'drift_k{}.csv'.format(k)))
+    if 'country_rfm' in result:
+        result['country_rfm'].to_csv(os.path.join(out_dir, 'country_customers.csv'), index=False)
+        for k, summary in result['country_summaries'].items():
+            summary.to_csv(os.path.join(out_dir, 'country_summary_k{}.csv'.format(k)))
+
+
+def validate(source, out_dir, cache_dir=DEFAULT_CACHE_DIR):
+    """Profile ``source`` in chunks and report its data-quality problems; True when there are none."""
+    from . import quality
+
+    profile = quality.profile(quality.read_chunks(source, cache_dir=cache_dir))
+    os.makedirs(out_dir, exist_ok=True)
+    profile.summary().to_csv(os.path.join(out_dir, 'profile.csv'))
+    found = quality.problems(profile)
+    for problem in found:
+        print('data-quality check failed: {}'.format(problem), file=sys.stderr)
+    return not found
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.export and args.export_k not in args.k:
+        parser.error('--export-k {} is not among the fitted k {}'.format(args.export_k, args.k))
+    if args.basket and (args.export or args.state_dir):
+        parser.error('--basket clusters are not exported or kept in --state-dir, which hold RFM centroids only')
+    if (args.rfm_state or args.cohort_state or args.dedup_index) and args.stage_cache:
+        parser.error('--stage-cache is keyed on the source only and cannot be used with '
+                     '--rfm-state, --cohort-state or --dedup-index')
+    if args.validate and not validate(args.source, args.output, args.cache_dir):
+        return 1
+    run_report = RunReport(args.cprofile, args.tracemalloc, args.profile_dir, budget_mb=args.memory_budget)
+    result = pipeline.run(args.source, k_values=args.k, window_days=args.window_days,
+                          report=args.report, with_elbow=args.elbow, cache_dir=args.cache_dir,
+                          n_jobs=args.jobs, score_sample=args.score_sample, model_dir=args.model_dir,
+                          run_report=run_report, compact=args.memory_budget is not None,
+                          net_cancellations=args.net_cancellations, quantiles=args.quantiles,
+                          countries=args.by_country, kmeans=args.kmeans, state_dir=args.state_dir,
+                          stage_cache_dir=args.stage_cache, stage_cache_mb=args.stage_cache_mb,
+                          snapshots=args.snapshots, basket_components=args.basket, basket_weight=args.basket_weight,
+                          rfm_state=args.rfm_state, cohort_state=args.cohort_state,
+                          dedup_index=args.dedup_index)
+    write_tables(result, args.output)
+    if args.run_report:
+        run_report.write(args.run_report)
+    for k, summary in result['summaries'].items():
+        print('K={}{}'.format(k, ' (retrained)' if result.get('retrained', {}).get(k) else ''))
+        print(summary)
+        print()
+    for country, reason in result.get('country_skipped', {}).items():
+        print('{} not segmented: {}'.format(country, reason))
+
+    if args.export:
+        from .serving import export
+        if 'segment_states' in result:
+            result['segment_states'][args.export_k].segment_model().save(args.export)
+        else:
+            export(result['scaler'], result['models'][args.export_k], args.export)
+
+    if args.report:
+        from . import report
+        report.render(result, os.path.join(args.output, 'figures'), formats=args.report_format, n_jobs=args.jobs)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Sparse customer x product basket matrix and its low-rank embedding.
+
+A dense pivot of customers by StockCode does not fit in memory beyond a few
+thousand of each, and is almost all zeros. :func:`matrix` builds it as a
+scipy CSR matrix straight from the integer codes of the CustomerID and the
+categorical StockCode, one chunk of transaction lines at a time: each chunk
+becomes a CSR block, and blocks of similar size are added together, so the
+memory stays proportional to the non-zeros and every entry is only copied a
+logarithmic number of times.
+
+:func:`embed` weighs the matrix with TF-IDF (products every customer buys
+say little about a customer) and reduces it with a truncated SVD, which works
+on the sparse matrix directly. :func:`combine` appends the embedding to the
+normalized RFM values, so KMeans clusters on what customers buy as well as on
+how recently, how often and how much:
+
+    X, customers, stock_codes = matrix(df, customers=data.CustomerID)
+    features = combine(data_norm, embed(X)[0])
+"""
+
+import numpy as np
+import pandas as pd
+
+from .clustering import CHUNK_ROWS, RANDOM_STATE
+
+N_COMPONENTS = 10
+
+
+def purchases(df):
+    """Mask of the product purchase lines: ``Kind == 'sale'`` in classified frames, else positive quantities."""
+    if 'Kind' in df.columns:
+        return (df.Kind == 'sale').to_numpy()
+    return (df.Quantity > 0).to_numpy()
+
+
+def matrix(df, customers=None, value='Quantity', chunk_rows=CHUNK_ROWS):
+    """CSR matrix of the summed ``value`` per customer (row) and StockCode (column).
+
+    Returns ``(X, customers, stock_codes)``. Rows follow the sorted
+    ``customers`` (by default every customer with a purchase); lines of other
+    customers are left out. Columns are the StockCode categories. Only the
+    :func:`purchases` lines count; ``value`` may be 'Quantity', 'Amount' or
+    their net counterparts.
+    """
+    from scipy import sparse
+
+    stock_code = df.StockCode.array if isinstance(df.StockCode.dtype, pd.CategoricalDtype) else \
+        pd.Categorical(df.StockCode)
+    codes, stock_codes = stock_code.codes, stock_code.categories
+    customer_id = df.CustomerID.to_numpy()
+    values = df[value].to_numpy()
+    mask = purchases(df) & (codes >= 0)
+    customers = np.unique(customer_id[mask]) if customers is None else np.sort(np.asarray(customers))
+
+    shape = (len(customers), len(stock_codes))
+    # Summed CSR blocks; the newest are added together while the older is at
+    # most twice as large, so every entry is copied O(log chunks) times.
+    blocks = []
+    for start in range(0, len(df), chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        keep = np.flatnonzero(mask[rows])
+        ids = customer_id[rows][keep]
+        row = np.minimum(np.searchsorted(customers, ids), max(len(customers) - 1, 0))
+        known = customers[row] == ids if len(customers) else np.zeros(len(ids), dtype=bool)
+        blocks.append(sparse.coo_matrix((values[rows][keep][known].astype('float64'),
+                                         (row[known], codes[rows][keep][known])), shape=shape).tocsr())
+        while len(blocks) > 1 and blocks[-2].nnz <= 2 * blocks[-1].nnz:
+            blocks[-2:] = [blocks[-2] + blocks[-1]]
+    while len(blocks) > 1:
+        blocks[-2:] = [blocks[-2] + blocks[-1]]
+    X = blocks[0] if blocks else sparse.csr_matrix(shape, dtype='float64')
+    return X, customers, pd.Index(stock_codes)
+
+
+def embed(X, n_components=N_COMPONENTS, random_state=RANDOM_STATE):
+    """TF-IDF weighted truncated SVD of a basket matrix: ``(embedding, (tfidf, svd))``.
+
+    Quantities are dampened with ``1 + log(tf)`` and every customer's row is
+    L2-normalized, so big spenders do not dominate the components.
+    """
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfTransformer
+
+    tfidf = TfidfTransformer(sublinear_tf=True)
+    svd = TruncatedSVD(n_components=n_components, random_state=random_state)
+    embedding = svd.fit_transform(tfidf.fit_transform(X.maximum(0)))
+    return embedding, (tfidf, svd)
+
+
+def combine(data_norm, embedding, weight=1.0):
+    """``data_norm`` with the standardized embedding appended as ``Basket1``, ``Basket2``, ...
+
+    The embedding columns are scaled so that together they carry ``weight``
+    times the variance of the ``data_norm`` columns; at 0 KMeans sees only RFM.
+    """
+    embedding = np.asarray(embedding, dtype='float64')
+    std = embedding.std(axis=0)
+    embedding = (embedding - embedding.mean(axis=0)) / np.where(std == 0, 1.0, std)
+    embedding *= np.sqrt(weight * data_norm.shape[1] / embedding.shape[1])
+    columns = ['Basket{}'.format(i + 1) for i in range(embedding.shape[1])]
+    return pd.concat([data_norm, pd.DataFrame(embedding, index=data_norm.index, columns=columns)], axis=1)
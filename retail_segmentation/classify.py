@@ -0,0 +1,68 @@
+"""Vectorized classification of transaction lines.
+
+Every line is tagged as a sale, a cancellation, postage, a fee, a discount or a
+manual adjustment. Non-product StockCodes are looked up in a rule table once
+per distinct code, and the 'C' cancellation prefix once per distinct
+InvoiceNo; the per-line work is array indexing. The result is stored as two
+compact columns: ``Kind``, a categorical with int8 codes, and ``Cancelled``.
+"""
+
+import numpy as np
+import pandas as pd
+
+KINDS = ['sale', 'cancellation', 'postage', 'fee', 'discount', 'adjustment']
+
+# Non-product StockCodes of the Online Retail data and their kind. Every other
+# code is a product: a sale, a cancellation ('C' invoice) or, when the
+# quantity is not positive, a stock adjustment.
+RULES = {
+    'POST': 'postage',
+    'DOT': 'postage',
+    'C2': 'postage',
+    'BANK CHARGES': 'fee',
+    'AMAZONFEE': 'fee',
+    'CRUK': 'fee',
+    'D': 'discount',
+    'M': 'adjustment',
+    'B': 'adjustment',
+    'S': 'adjustment',
+    'PADS': 'adjustment',
+}
+
+SALE, CANCELLATION, ADJUSTMENT = KINDS.index('sale'), KINDS.index('cancellation'), KINDS.index('adjustment')
+
+
+def cancelled(invoice_no):
+    """Boolean array flagging InvoiceNo values with the 'C' prefix."""
+    codes, uniques = pd.factorize(invoice_no)
+    return pd.Series(uniques).astype(str).str.startswith('C').to_numpy()[codes]
+
+
+def kinds(stock_code, cancelled, quantity, rules=RULES):
+    """Kind of every line as a categorical over :data:`KINDS`.
+
+    ``rules`` maps non-product StockCodes to a kind and takes precedence over
+    the cancellation flag, so a refunded postage line stays postage.
+    """
+    unknown = set(rules.values()) - set(KINDS)
+    if unknown:
+        raise ValueError('unknown kinds in rules: {}'.format(sorted(unknown)))
+    codes, uniques = pd.factorize(stock_code)
+    rule = pd.Series(np.asarray(uniques, dtype=object)).map(
+        {code: KINDS.index(kind) for code, kind in rules.items()}).fillna(-1).to_numpy('int8')
+    kind = rule[codes]
+    product = kind < 0
+    kind[product] = np.where(np.asarray(cancelled)[product], CANCELLATION,
+                             np.where(np.asarray(quantity)[product] > 0, SALE, ADJUSTMENT))
+    return pd.Categorical.from_codes(kind, KINDS)
+
+
+def classify(df, rules=RULES):
+    """Add the ``Kind`` and ``Cancelled`` columns to ``df`` in place and return it.
+
+    Compact frames already carry ``Cancelled``; it is reused.
+    """
+    if 'Cancelled' not in df.columns:
+        df['Cancelled'] = cancelled(df.InvoiceNo)
+    df['Kind'] = kinds(df.StockCode, df.Cancelled.to_numpy(), df.Quantity.to_numpy(), rules)
+    return df
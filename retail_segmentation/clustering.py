@@ -0,0 +1,294 @@
+"""K-means fitting, the K-selection sweep and a cache of fitted models.
+
+Models are cached by ``(k, random_state, fingerprint of the data)``, so the
+k = 3, 4, 5 models used for the summaries are the ones fitted by the elbow
+sweep instead of being refitted. The sweep runs on a thread pool by default:
+scikit-learn's Lloyd iterations release the GIL, so threads share the data
+without copying it. A process pool is available as well; the data is sent to
+each worker once, not with every task.
+"""
+
+import hashlib
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .rfm import RFM_COLUMNS
+
+RANDOM_STATE = 1
+K_RANGE = range(1, 25)
+
+
+def fingerprint(X):
+    """Short content hash of a data matrix."""
+    X = np.ascontiguousarray(X, dtype='float64')
+    h = hashlib.sha1(str(X.shape).encode())
+    h.update(X.data)
+    return h.hexdigest()[:16]
+
+
+def fit_kmeans(X, k, random_state=RANDOM_STATE):
+    from sklearn.cluster import KMeans
+
+    model = KMeans(n_clusters=k, random_state=random_state)
+    model.fit(X)
+    return model
+
+
+class ModelCache:
+    """Fitted KMeans models keyed by ``(k, random_state, fingerprint)``.
+
+    Models are kept in memory and, when ``directory`` is given, pickled there so
+    later runs on the same data reuse them.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._models = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, 'kmeans-k{}-s{}-{}.pkl'.format(*key))
+
+    def get(self, key):
+        if key in self._models:
+            return self._models[key]
+        if self.directory and os.path.exists(self._path(key)):
+            with open(self._path(key), 'rb') as f:
+                self._models[key] = pickle.load(f)
+            return self._models[key]
+        return None
+
+    def put(self, key, model):
+        self._models[key] = model
+        if self.directory:
+            tmp = self._path(key) + '.tmp'
+            with open(tmp, 'wb') as f:
+                pickle.dump(model, f)
+            os.replace(tmp, self._path(key))
+
+    def fit(self, X, k, random_state=RANDOM_STATE, fp=None):
+        """Cached model for ``k`` clusters, fitted on ``X`` if missing."""
+        key = (k, random_state, fp or fingerprint(X))
+        model = self.get(key)
+        if model is None:
+            model = fit_kmeans(X, k, random_state)
+            self.put(key, model)
+        return model
+
+
+_worker_data = None
+
+
+def _init_worker(X):
+    global _worker_data
+    from threadpoolctl import threadpool_limits
+    _worker_data = (X, threadpool_limits(limits=1))
+
+
+def _fit_in_worker(k, random_state):
+    return fit_kmeans(_worker_data[0], k, random_state)
+
+
+def scores(X, labels, sample_size=None, random_state=RANDOM_STATE):
+    """Silhouette and Davies-Bouldin scores, on a random subsample of ``sample_size`` rows.
+
+    The silhouette is O(n^2) in the number of rows, so large inputs should be
+    subsampled. Both scores are NaN for a single cluster.
+    """
+    from sklearn.metrics import davies_bouldin_score, silhouette_score
+
+    X = np.asarray(X)
+    if sample_size and sample_size < len(X):
+        idx = np.random.default_rng(random_state).choice(len(X), sample_size, replace=False)
+        X, labels = X[idx], labels[idx]
+    if len(np.unique(labels)) < 2:
+        return np.nan, np.nan
+    return silhouette_score(X, labels), davies_bouldin_score(X, labels)
+
+
+def sweep(X, k_values=K_RANGE, random_state=RANDOM_STATE, n_jobs=None, backend='thread',
+          cache=None, score_sample=None):
+    """Fit KMeans for every k in ``k_values`` on a pool and collect the inertia.
+
+    Returns a DataFrame indexed by k with an ``inertia`` column, plus
+    ``silhouette`` and ``davies_bouldin`` when ``score_sample`` (number of rows
+    to score on) is given. Fitted models are stored in ``cache``.
+    """
+    cache = cache if cache is not None else ModelCache()
+    X = np.ascontiguousarray(X, dtype='float64')
+    fp = fingerprint(X)
+    k_values = list(k_values)
+    missing = [k for k in k_values if cache.get((k, random_state, fp)) is None]
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(missing) or 1)
+
+    if n_jobs == 1 or len(missing) < 2:
+        for k in missing:
+            cache.put((k, random_state, fp), fit_kmeans(X, k, random_state))
+    elif backend == 'process':
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(X,)) as pool:
+            for k, model in zip(missing, pool.map(_fit_in_worker, missing, [random_state] * len(missing))):
+                cache.put((k, random_state, fp), model)
+    else:
+        from threadpoolctl import threadpool_limits
+
+        # One OpenMP thread per fit, the pool provides the parallelism.
+        with threadpool_limits(limits=1), ThreadPoolExecutor(n_jobs) as pool:
+            models = list(pool.map(lambda k: fit_kmeans(X, k, random_state), missing))
+        for k, model in zip(missing, models):
+            cache.put((k, random_state, fp), model)
+
+    rows = []
+    for k in k_values:
+        model = cache.get((k, random_state, fp))
+        row = {'k': k, 'inertia': model.inertia_}
+        if score_sample:
+            row['silhouette'], row['davies_bouldin'] = scores(X, model.labels_, score_sample, random_state)
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('k')
+
+
+# Rows per chunk when streaming over memory-mapped data.
+CHUNK_ROWS = 1000000
+CORESET_SIZE = 50000
+
+
+def _chunks(X, chunk_rows=CHUNK_ROWS):
+    for start in range(0, len(X), chunk_rows):
+        yield start, np.array(X[start:start + chunk_rows], dtype='float64')
+
+
+def scale_to_memmap(data, path, columns=None, chunk_rows=CHUNK_ROWS):
+    """Log-transform and standardize ``data`` chunk by chunk into a ``.npy`` memory map.
+
+    Returns ``(scaler, X)``: a StandardScaler fitted with ``partial_fit`` over
+    the chunks, and the normalized rows opened read-only with ``mmap_mode``.
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    columns = columns or RFM_COLUMNS
+    values = [data[col].to_numpy() for col in columns]
+
+    def chunk(start):
+        return np.log(np.column_stack([v[start:start + chunk_rows] for v in values]).astype('float64'))
+
+    scaler = StandardScaler()
+    for start in range(0, len(data), chunk_rows):
+        scaler.partial_fit(chunk(start))
+    out = np.lib.format.open_memmap(path, mode='w+', dtype='float64', shape=(len(data), len(columns)))
+    for start in range(0, len(data), chunk_rows):
+        out[start:start + chunk_rows] = scaler.transform(chunk(start))
+    out.flush()
+    del out
+    return scaler, np.load(path, mmap_mode='r')
+
+
+def coreset(X, size=CORESET_SIZE, random_state=RANDOM_STATE, chunk_rows=CHUNK_ROWS):
+    """Lightweight coreset of ``X``: ``(points, weights)``, in three streaming passes.
+
+    Rows are drawn with probability half uniform, half proportional to their
+    squared distance to the mean, and weighted by the inverse, so the weighted
+    k-means cost of the coreset estimates the cost of ``X`` for any centroids
+    (Bachem, Lucic and Krause, 2018). When all rows are (numerically) equal
+    there is no distance to weigh by and the draw is uniform.
+    """
+    n = len(X)
+    if n <= size:
+        return np.asarray(X, dtype='float64'), np.ones(n)
+    total, squares = 0.0, 0.0
+    for _, chunk in _chunks(X, chunk_rows):
+        total = total + chunk.sum(axis=0)
+        squares += (chunk ** 2).sum()
+    mean = total / n
+    spread = squares - n * (mean ** 2).sum()
+
+    def probability(chunk):
+        # The subtraction above only leaves rounding noise of the order of eps * squares.
+        if spread <= 1e-9 * squares:
+            return np.full(len(chunk), 1.0 / n)
+        return 0.5 / n + 0.5 * ((chunk - mean) ** 2).sum(axis=1) / spread
+
+    # How many of the samples fall in each chunk, then which rows within it.
+    rng = np.random.default_rng(random_state)
+    counts = rng.multinomial(size, [probability(chunk).sum() for _, chunk in _chunks(X, chunk_rows)])
+    points, weights = [], []
+    for (_, chunk), m in zip(_chunks(X, chunk_rows), counts):
+        if m:
+            p = probability(chunk)
+            idx = rng.choice(len(chunk), m, p=p / p.sum())
+            points.append(chunk[idx])
+            weights.append(1.0 / (size * p[idx]))
+    return np.concatenate(points), np.concatenate(weights)
+
+
+class StreamedKMeans:
+    """Centroids fitted on a coreset or mini-batches, with every row labelled in chunks.
+
+    Has the ``cluster_centers_``, ``labels_`` and ``inertia_`` of a fitted
+    KMeans, so it can stand in for one in the summaries, the report and
+    :func:`retail_segmentation.serving.export`.
+    """
+
+    def __init__(self, centroids, labels, inertia, sizes):
+        self.cluster_centers_ = centroids
+        self.labels_ = labels
+        self.inertia_ = inertia
+        self.sizes = sizes
+        self.n_clusters = len(centroids)
+
+    def predict(self, X):
+        return assign(X, self.cluster_centers_)[0]
+
+
+def assign(X, centroids, chunk_rows=CHUNK_ROWS):
+    """``(labels, inertia, sizes, sums)`` of the nearest centroid for every row, chunk by chunk."""
+    centroids = np.asarray(centroids, dtype='float64')
+    centroid_sq = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(X), dtype='int32')
+    inertia = 0.0
+    sizes = np.zeros(len(centroids), dtype='int64')
+    sums = np.zeros_like(centroids)
+    for start, chunk in _chunks(X, chunk_rows):
+        distance = centroid_sq - 2.0 * chunk @ centroids.T
+        nearest = np.argmin(distance, axis=1)
+        labels[start:start + len(chunk)] = nearest
+        inertia += ((chunk ** 2).sum(axis=1) + distance[np.arange(len(chunk)), nearest]).sum()
+        sizes += np.bincount(nearest, minlength=len(centroids))
+        for c in range(len(centroids)):
+            sums[c] += chunk[nearest == c].sum(axis=0)
+    return labels, max(inertia, 0.0), sizes, sums
+
+
+def fit_streamed(X, k, method='coreset', random_state=RANDOM_STATE, coreset_size=CORESET_SIZE,
+                 chunk_rows=CHUNK_ROWS, batch_size=4096, min_batches=100):
+    """Fit ``k`` centroids without Lloyd iterations over all of ``X`` and label every row.
+
+    ``method='coreset'`` runs KMeans on a weighted :func:`coreset`;
+    ``'minibatch'`` feeds the chunks to MiniBatchKMeans.partial_fit in
+    shuffled batches of ``batch_size``, passing over ``X`` as often as it
+    takes to make ``min_batches`` updates. ``X`` may be a memory map.
+    """
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if method == 'coreset':
+        points, weights = coreset(X, coreset_size, random_state, chunk_rows)
+        model = KMeans(n_clusters=k, random_state=random_state).fit(points, sample_weight=weights)
+    elif method == 'minibatch':
+        model = MiniBatchKMeans(n_clusters=k, random_state=random_state, batch_size=batch_size)
+        rng = np.random.default_rng(random_state)
+        passes = -(-min_batches * batch_size // len(X))
+        for _ in range(passes):
+            for _, chunk in _chunks(X, chunk_rows):
+                rng.shuffle(chunk)
+                for start in range(0, len(chunk), batch_size):
+                    batch = chunk[start:start + batch_size]
+                    if len(batch) >= k:
+                        model.partial_fit(batch)
+    else:
+        raise ValueError("method must be 'coreset' or 'minibatch', not {!r}".format(method))
+    labels, inertia, sizes, _ = assign(X, model.cluster_centers_, chunk_rows)
+    return StreamedKMeans(model.cluster_centers_, labels, inertia, sizes)
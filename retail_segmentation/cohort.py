@@ -0,0 +1,173 @@
+"""Vectorized cohort engine on integer calendar months.
+
+Every InvoiceDate is turned into a month number (months since 1970-01), so the
+CohortMonth of a customer is a grouped ``min`` broadcast back with
+``transform`` and the CohortIndex is an exact integer difference of calendar
+months. No row-wise ``apply`` and no merge of the grouping back onto the
+transaction table are needed.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .ingest import date_column
+
+
+def month_number(dates):
+    """Calendar month of each date as an int32 count of months since 1970-01.
+
+    Integer input is taken as day numbers since 1970-01-01 (``InvoiceDay``).
+    """
+    dates = np.asarray(dates)
+    if dates.dtype.kind in 'iu':
+        return dates.astype('datetime64[D]').astype('datetime64[M]').astype('int32')
+    return dates.astype('datetime64[ns]').astype('datetime64[M]').astype('int32')
+
+
+def month_start(months):
+    """First day of each month number, as datetime64."""
+    return np.asarray(months, dtype='int64').astype('datetime64[M]').astype('datetime64[ns]')
+
+
+def assign(customer_ids, dates):
+    """Cohort month number and CohortIndex of every transaction.
+
+    Returns ``(cohort_month, cohort_index)`` as int32 and int16 arrays aligned
+    with the inputs.
+    """
+    month = month_number(dates)
+    cohort_month = pd.Series(month).groupby(np.asarray(customer_ids)).transform('min').to_numpy()
+    return cohort_month, (month - cohort_month).astype('int16')
+
+
+def counts(customer_ids, cohort_month, cohort_index):
+    """Distinct active customers per CohortMonth (rows) and CohortIndex (columns)."""
+    active = pd.Series(np.asarray(customer_ids)).groupby(
+        [np.asarray(cohort_month), np.asarray(cohort_index)]).nunique()
+    cohort_counts = active.unstack()
+    cohort_counts.index = pd.Index(month_start(cohort_counts.index), name='CohortMonth')
+    cohort_counts.columns.name = 'CohortIndex'
+    return cohort_counts
+
+
+def retention(cohort_counts):
+    """Share of each cohort still active, in percent, rounded like the notebook."""
+    cohort_sizes = cohort_counts.iloc[:, 0]
+    return cohort_counts.divide(cohort_sizes, axis=0).round(3) * 100
+
+
+def compute(df):
+    """``(cohort_counts, retention)`` of a transaction table."""
+    cohort_month, cohort_index = assign(df.CustomerID, df[date_column(df)])
+    cohort_counts = counts(df.CustomerID, cohort_month, cohort_index)
+    return cohort_counts, retention(cohort_counts)
+
+
+class CohortState:
+    """Cohort month and active-month bitmap of every customer, updatable in place.
+
+    Rows are addressed directly by the integer CustomerID. Bit ``b`` of a
+    customer's bitmap is set when they were active in month ``origin + b``, and
+    ``counts[c, i]`` holds the number of customers of cohort ``origin + c``
+    active ``i`` months later. :meth:`update` only touches the customers of the
+    incoming batch, so folding in a month costs time proportional to that month.
+    """
+
+    def __init__(self, origin=None, cohort_month=None, bitmap=None, counts=None):
+        self.origin = origin
+        self.cohort_month = np.full(0, -1, dtype='int32') if cohort_month is None else cohort_month
+        self.bitmap = np.zeros((0, 1), dtype='uint64') if bitmap is None else bitmap
+        self.counts = np.zeros((0, 0), dtype='int64') if counts is None else counts
+
+    @classmethod
+    def from_transactions(cls, df):
+        state = cls()
+        state.update(df.CustomerID, df[date_column(df)])
+        return state
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            origin = int(f['origin']) if f['origin'] >= 0 else None
+            return cls(origin, f['cohort_month'], f['bitmap'], f['counts'])
+
+    def save(self, path):
+        np.savez(path, origin=-1 if self.origin is None else self.origin,
+                 cohort_month=self.cohort_month, bitmap=self.bitmap, counts=self.counts)
+
+    def _reserve(self, max_customer, max_offset):
+        """Grow the arrays (by doubling) to hold ``max_customer`` and ``max_offset``."""
+        if max_customer >= len(self.cohort_month):
+            size = max(max_customer + 1, 2 * len(self.cohort_month))
+            cohort_month = np.full(size, -1, dtype='int32')
+            cohort_month[:len(self.cohort_month)] = self.cohort_month
+            bitmap = np.zeros((size, self.bitmap.shape[1]), dtype='uint64')
+            bitmap[:len(self.bitmap)] = self.bitmap
+            self.cohort_month, self.bitmap = cohort_month, bitmap
+        if max_offset >= 64 * self.bitmap.shape[1]:
+            words = max_offset // 64 + 1
+            self.bitmap = np.pad(self.bitmap, ((0, 0), (0, words - self.bitmap.shape[1])))
+        if max_offset >= len(self.counts):
+            self.counts = np.pad(self.counts, ((0, max_offset + 1 - len(self.counts)),) * 2)
+
+    def _active(self, customers):
+        """``(customer, month offset)`` of every set bit of ``customers``."""
+        bits = np.unpackbits(self.bitmap[customers].astype('<u8').view(np.uint8), axis=1, bitorder='little')
+        rows, offsets = np.nonzero(bits)
+        return customers[rows], offsets
+
+    def _tally(self, customers, sign):
+        """Add (``sign=1``) or remove (``sign=-1``) the contribution of ``customers``."""
+        customers = customers[self.cohort_month[customers] >= 0]
+        ids, offsets = self._active(customers)
+        cohort = self.cohort_month[ids] - self.origin
+        np.add.at(self.counts, (cohort, offsets - cohort), sign)
+
+    def update(self, customer_ids, dates):
+        """Fold a batch of transactions into the state."""
+        batch = pd.DataFrame({'customer': np.asarray(customer_ids, dtype='int64'),
+                              'month': month_number(dates)}).drop_duplicates()
+        if batch.empty:
+            return self
+        if self.origin is None:
+            self.origin = int(batch.month.min())
+        if batch.month.min() < self.origin:
+            raise ValueError('transactions before the first month of the state; rebuild it from scratch')
+
+        customer = batch.customer.to_numpy()
+        offset = (batch.month.to_numpy() - self.origin).astype('int64')
+        self._reserve(int(customer.max()), int(offset.max()))
+
+        # Cohorts can only move earlier, and only for customers of the batch:
+        # take their contribution out, update them, and add it back.
+        touched = np.unique(customer)
+        self._tally(touched, -1)
+        first = pd.Series(offset).groupby(customer).min()
+        previous = self.cohort_month[first.index]
+        self.cohort_month[first.index] = np.where(
+            previous >= 0, np.minimum(previous, first.to_numpy() + self.origin), first.to_numpy() + self.origin)
+        np.bitwise_or.at(self.bitmap, (customer, offset // 64), np.uint64(1) << (offset % 64).astype('uint64'))
+        self._tally(touched, 1)
+        return self
+
+    def cohort_counts(self):
+        """Same table as :func:`counts` over the full history."""
+        table = pd.DataFrame(self.counts).replace(0, np.nan)
+        table = table.dropna(how='all').dropna(axis=1, how='all')
+        table.index = pd.Index(month_start(table.index + self.origin), name='CohortMonth')
+        table.columns.name = 'CohortIndex'
+        return table
+
+    def retention(self):
+        return retention(self.cohort_counts())
+
+
+def matches_rebuild(state, df):
+    """Whether ``state`` agrees with a full rebuild of the cohort table from ``df``."""
+    expected, _ = compute(df)
+    try:
+        pd.testing.assert_frame_equal(state.cohort_counts(), expected, check_dtype=False,
+                                      check_index_type=False, check_column_type=False)
+    except AssertionError:
+        return False
+    return True
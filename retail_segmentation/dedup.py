@@ -0,0 +1,121 @@
+"""Hash-based deduplication of transaction lines, within and across batches.
+
+Every line gets a 64-bit fingerprint of its values, computed once per batch.
+Duplicates inside a batch are found with one hash table over the fingerprints,
+and :class:`FingerprintIndex` remembers the fingerprints of every batch
+already processed, so appending a month costs time proportional to that month
+instead of deduplicating the whole history again.
+
+Two different lines share a fingerprint with probability about n^2 / 2^65
+(under 0.03% for 100M lines); such a line would be dropped as a duplicate.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Columns added by the pipeline; they follow from the others.
+DERIVED = ['Amount', 'Kind', 'CohortMonth', 'CohortIndex']
+
+# Source columns left out of the fingerprint. Description is only loaded for
+# the report, and comparing it would make the duplicates depend on --report.
+IGNORED = ['Description']
+
+
+def fingerprint(df):
+    """uint64 fingerprint of every line of ``df`` over its source columns except Description.
+
+    Unlike ``drop_duplicates()`` in the notebook, lines that only differ in
+    their Description count as duplicates, whether or not it was loaded.
+    Values hash the same whatever the row position, so fingerprints of
+    different batches can be compared, as long as they were loaded with the same
+    types (compact frames hash differently from regular ones).
+    """
+    columns = [c for c in df.columns if c not in DERIVED + IGNORED]
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+class FingerprintIndex:
+    """Fingerprints of every line already kept, in sorted runs.
+
+    New fingerprints are appended as a sorted run, and runs of similar length
+    are merged, so lookups stay a binary search over a few runs and adding a
+    batch costs amortized O(batch log history). ``rows`` and ``duplicates``
+    count the lines offered and dropped over all batches; ``last`` holds the
+    ``(within, across)`` duplicate counts of the latest batch.
+    """
+
+    def __init__(self, fingerprints=None, rows=0, duplicates=0):
+        fingerprints = np.zeros(0, dtype='uint64') if fingerprints is None else fingerprints
+        self._runs = [np.sort(fingerprints)] if len(fingerprints) else []
+        self.rows = rows
+        self.duplicates = duplicates
+        self.last = (0, 0)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['fingerprints'], int(f['rows']), int(f['duplicates']))
+
+    def save(self, path):
+        np.savez(path, fingerprints=self.fingerprints(), rows=self.rows, duplicates=self.duplicates)
+
+    def __len__(self):
+        return sum(len(run) for run in self._runs)
+
+    def fingerprints(self):
+        """Every fingerprint in the index, sorted."""
+        self._merge(full=True)
+        return self._runs[0] if self._runs else np.zeros(0, dtype='uint64')
+
+    def _merge(self, full=False):
+        """Merge the newest runs while the older is at most twice as long (all of them with ``full``)."""
+        runs = self._runs
+        while len(runs) > 1 and (full or len(runs[-2]) <= 2 * len(runs[-1])):
+            # Both runs are sorted; the stable sort finds them and merges in linear time.
+            runs[-2:] = [np.sort(np.concatenate(runs[-2:]), kind='stable')]
+
+    def contains(self, fingerprints):
+        """Boolean mask of the ``fingerprints`` already in the index."""
+        fingerprints = np.asarray(fingerprints, dtype='uint64')
+        seen = np.zeros(len(fingerprints), dtype=bool)
+        for run in self._runs:
+            pos = np.minimum(np.searchsorted(run, fingerprints), len(run) - 1)
+            seen |= run[pos] == fingerprints
+        return seen
+
+    def add(self, fingerprints):
+        """Record a batch; returns the mask of lines to keep.
+
+        A line is dropped when an earlier line of the batch or of a previous
+        batch has the same fingerprint.
+        """
+        fingerprints = np.asarray(fingerprints, dtype='uint64')
+        within = pd.Series(fingerprints).duplicated().to_numpy()
+        across = ~within & self.contains(fingerprints)
+        keep = ~(within | across)
+        if keep.any():
+            self._runs.append(np.sort(fingerprints[keep]))
+            self._merge()
+        self.last = (int(within.sum()), int(across.sum()))
+        self.rows += len(fingerprints)
+        self.duplicates += sum(self.last)
+        return keep
+
+
+def drop_duplicates(df, index=None):
+    """``(df without duplicate lines, (within, across) counts)``.
+
+    Without ``index`` only duplicates inside ``df`` are dropped; with a
+    :class:`FingerprintIndex` lines seen in earlier batches are dropped too and
+    the kept ones are added to it. ``df`` is only copied when lines are dropped.
+    """
+    fingerprints = fingerprint(df)
+    if index is None:
+        keep = ~pd.Series(fingerprints).duplicated().to_numpy()
+        counts = (int(len(keep) - keep.sum()), 0)
+    else:
+        keep = index.add(fingerprints)
+        counts = index.last
+    df = df.copy(deep=False) if keep.all() else df[keep]
+    df.index = pd.RangeIndex(len(df))
+    return df, counts
@@ -0,0 +1,233 @@
+"""Columnar ingestion cache for the Online Retail workbook.
+
+Parsing ``Online_Retail.xlsx`` with ``pd.read_excel`` dominates the run time of
+the pipeline. The workbook is converted once into a typed Parquet file keyed by
+the SHA-256 of the source, so later runs only memory-map the columns a stage
+actually needs.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - the cache is skipped without pyarrow
+    pa = None
+    pc = None
+    pq = None
+
+COLUMNS = ['InvoiceNo', 'StockCode', 'Description', 'Quantity',
+           'InvoiceDate', 'UnitPrice', 'CustomerID', 'Country']
+
+# Columns used by the cleaning, cohort and RFM stages (Description is only needed
+# for the exploratory report).
+STAGE_COLUMNS = ['InvoiceNo', 'StockCode', 'Quantity', 'InvoiceDate',
+                 'UnitPrice', 'CustomerID', 'Country']
+
+# String columns held as categoricals in compact frames.
+CATEGORICAL = ['StockCode', 'Description', 'Country']
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'RETAIL_SEGMENTATION_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'retail_segmentation'))
+
+_INDEX_FILE = 'index.json'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of the file at ``path``."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, _INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_index(cache_dir, index):
+    tmp = os.path.join(cache_dir, _INDEX_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(cache_dir, _INDEX_FILE))
+
+
+def source_digest(source, cache_dir=DEFAULT_CACHE_DIR):
+    """Digest of ``source``, reusing the recorded one while size and mtime match.
+
+    Hashing the workbook is cheap next to parsing it, but it still reads every
+    byte, so the digest is remembered per (path, size, mtime).
+    """
+    st = os.stat(source)
+    key = os.path.abspath(source)
+    index = _read_index(cache_dir)
+    entry = index.get(key)
+    if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+        return entry['sha256']
+
+    digest = file_digest(source)
+    if os.path.isdir(cache_dir):
+        index[key] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+        _write_index(cache_dir, index)
+    return digest
+
+
+def cache_path(source, cache_dir=DEFAULT_CACHE_DIR):
+    """Location of the Parquet cache for ``source``."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(cache_dir, '{}-{}.parquet'.format(stem, source_digest(source, cache_dir)[:16]))
+
+
+def normalize_types(df):
+    """Coerce a raw transaction frame to the types stored in the cache.
+
+    ``read_excel`` yields mixed int/str object columns for InvoiceNo and
+    StockCode; both are kept as strings so the 'C' cancellation prefix and the
+    peculiar codes (POST, D, M, ...) survive the round trip. CustomerID stays
+    float64 because it holds NaN for anonymous transactions.
+    """
+    df = df[COLUMNS].copy()
+    for col in ['InvoiceNo', 'StockCode', 'Description', 'Country']:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    df['Quantity'] = df['Quantity'].astype('int64')
+    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    df['UnitPrice'] = df['UnitPrice'].astype('float64')
+    df['CustomerID'] = df['CustomerID'].astype('float64')
+    return df
+
+
+def build_cache(source, cache_dir=DEFAULT_CACHE_DIR):
+    """Parse ``source`` once and write it as Parquet. Returns the cache path."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(source, cache_dir)
+    if os.path.exists(path):
+        return path
+
+    df = normalize_types(pd.read_excel(source))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = path + '.tmp'
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def read_parquet(path, columns=None):
+    """Memory-map ``columns`` of a Parquet transaction file into a DataFrame."""
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def load_transactions(source, columns=None, cache_dir=DEFAULT_CACHE_DIR, use_cache=True):
+    """Load the Online Retail transactions from ``source``.
+
+    ``source`` may be the original workbook, a CSV export or an already built
+    Parquet file. Workbooks are converted to the columnar cache on first use;
+    later calls read only ``columns`` (all of :data:`COLUMNS` by default).
+    """
+    ext = os.path.splitext(source)[1].lower()
+    if ext == '.parquet' and pq is not None:
+        return read_parquet(source, columns)
+    if ext == '.csv':
+        return normalize_types(pd.read_csv(source, dtype={'InvoiceNo': str, 'StockCode': str}))[columns or COLUMNS]
+
+    if not use_cache or pq is None:
+        return normalize_types(pd.read_excel(source))[columns or COLUMNS]
+    return read_parquet(build_cache(source, cache_dir), columns)
+
+
+def date_column(df):
+    """Name of the date column: 'InvoiceDay' in compact frames, else 'InvoiceDate'."""
+    return 'InvoiceDay' if 'InvoiceDay' in df.columns else 'InvoiceDate'
+
+
+def invoice_numbers(invoice_no):
+    """``(number, cancelled)`` of InvoiceNo strings like '536365' or 'C536379'.
+
+    The number is the int64 after any letter prefix; ``cancelled`` flags the
+    'C' prefix. Only distinct values are parsed.
+    """
+    codes, uniques = pd.factorize(pd.Series(invoice_no).astype(str))
+    uniques = pd.Series(uniques)
+    numbers = uniques.str.lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ').astype('int64').to_numpy()
+    cancelled = uniques.str.startswith('C').to_numpy()
+    return numbers[codes], cancelled[codes]
+
+
+def compact_types(df):
+    """Compact copy of a transaction frame, for the memory-budget mode.
+
+    Anonymous transactions are dropped so CustomerID fits int32; InvoiceNo
+    becomes an int64 number plus a ``Cancelled`` flag; StockCode, Description
+    and Country become categoricals; InvoiceDate is replaced by ``InvoiceDay``,
+    the int32 day number since 1970-01-01; Quantity is int32. Letter prefixes
+    other than 'C' (the 'A' bad-debt adjustments) are not kept; in the Online
+    Retail data those lines have no CustomerID anyway.
+    """
+    df = df[df.CustomerID.notna()]
+    number, cancelled = invoice_numbers(df.InvoiceNo)
+    out = pd.DataFrame({'InvoiceNo': number, 'Cancelled': cancelled})
+    for col in df.columns:
+        if col in CATEGORICAL:
+            out[col] = pd.Categorical(df[col])
+        elif col == 'Quantity':
+            out[col] = df[col].to_numpy().astype('int32')
+        elif col == 'InvoiceDate':
+            out['InvoiceDay'] = np.asarray(df[col], dtype='datetime64[D]').astype('int32')
+        elif col == 'CustomerID':
+            out[col] = df[col].to_numpy().astype('int32')
+        elif col != 'InvoiceNo':
+            out[col] = df[col].to_numpy()
+    return out
+
+
+def read_compact(path, columns=None):
+    """Read a Parquet transaction file straight into the compact types of :func:`compact_types`.
+
+    String columns are decoded as Arrow dictionaries, so no per-row Python
+    string is ever created, and anonymous lines are filtered inside Arrow.
+    """
+    columns = columns or COLUMNS
+    table = pq.read_table(path, columns=columns, memory_map=True,
+                          read_dictionary=[c for c in columns if c in CATEGORICAL + ['InvoiceNo']])
+    table = table.filter(pc.is_valid(table['CustomerID']))
+
+    out = {}
+    for col in columns:
+        column = table[col]
+        if col == 'InvoiceNo':
+            column = column.combine_chunks()
+            numbers, cancelled = invoice_numbers(column.dictionary.to_pandas())
+            indices = column.indices.to_numpy(zero_copy_only=False)
+            out['InvoiceNo'], out['Cancelled'] = numbers[indices], cancelled[indices]
+        elif col in CATEGORICAL:
+            out[col] = column.to_pandas()
+        elif col == 'InvoiceDate':
+            out['InvoiceDay'] = pc.cast(pc.cast(column, pa.date32()), pa.int32()).to_numpy()
+        elif col == 'CustomerID':
+            out[col] = column.to_numpy().astype('int32')
+        elif col == 'Quantity':
+            out[col] = column.to_numpy().astype('int32')
+        else:
+            out[col] = column.to_numpy()
+    return pd.DataFrame(out)
+
+
+def load_compact(source, columns=None, cache_dir=DEFAULT_CACHE_DIR):
+    """:func:`load_transactions` for the memory-budget mode; see :func:`compact_types`."""
+    ext = os.path.splitext(source)[1].lower()
+    if pq is None or ext == '.csv':
+        return compact_types(load_transactions(source, columns, cache_dir))
+    path = source if ext == '.parquet' else build_cache(source, cache_dir)
+    return read_compact(path, columns)
@@ -0,0 +1,135 @@
+"""Per-stage timing and memory instrumentation with a machine-readable run report.
+
+Every pipeline stage runs inside :meth:`RunReport.stage`, which records wall
+time, CPU time, peak RSS and rows in/out. On Linux the RSS high-water mark is
+reset before each stage (``/proc/self/clear_refs``), so the peak is the
+stage's own; elsewhere it is the process peak so far. cProfile and tracemalloc
+captures can be switched on per stage by name.
+"""
+
+import contextlib
+import cProfile
+import csv
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import warnings
+
+# Columns of the CSV report. The last ones are only set by some stages: cache
+# hits, duplicates dropped by dedup, unmatched cancellations of net and the
+# number of k refitted by the cluster stage with a state directory.
+FIELDS = ['stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'rows_in', 'rows_out', 'traced_peak_mb', 'over_budget',
+          'cached', 'duplicates', 'unmatched', 'retrained']
+
+
+def _reset_peak_rss():
+    """Reset the RSS high-water mark; False where the platform cannot."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident set size in MB (since the last reset on Linux)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 1024
+
+
+class RunReport:
+    """Stage records of one pipeline run.
+
+    ``cprofile_stages`` and ``tracemalloc_stages`` are the stage names to capture;
+    cProfile stats are dumped to ``<profile_dir>/<stage>.prof`` and the top
+    tracemalloc allocation sites to ``<profile_dir>/<stage>.tracemalloc.txt``.
+    With ``budget_mb``, every stage whose peak RSS exceeds it is flagged
+    ``over_budget`` and a :class:`ResourceWarning` is issued.
+    """
+
+    def __init__(self, cprofile_stages=(), tracemalloc_stages=(), profile_dir='profiles', budget_mb=None):
+        self.records = []
+        self.budget_mb = budget_mb
+        self.cprofile_stages = set(cprofile_stages)
+        self.tracemalloc_stages = set(tracemalloc_stages)
+        self.profile_dir = profile_dir
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        """Measure the enclosed block; set ``record['rows_out']`` inside it."""
+        record = {'stage': name, 'rows_in': rows_in, 'rows_out': None, 'traced_peak_mb': None,
+                  'over_budget': None}
+        profiler = cProfile.Profile() if name in self.cprofile_stages else None
+        trace = name in self.tracemalloc_stages and not tracemalloc.is_tracing()
+        if profiler or trace:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        if trace:
+            tracemalloc.start()
+        _reset_peak_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record['wall_s'] = round(time.perf_counter() - wall, 4)
+            record['cpu_s'] = round(time.process_time() - cpu, 4)
+            record['peak_rss_mb'] = round(peak_rss_mb(), 1)
+            if self.budget_mb is not None:
+                record['over_budget'] = record['peak_rss_mb'] > self.budget_mb
+                if record['over_budget']:
+                    warnings.warn('stage {} peaked at {} MB, over the {} MB budget'.format(
+                        name, record['peak_rss_mb'], self.budget_mb), ResourceWarning)
+            if profiler:
+                profiler.dump_stats(os.path.join(self.profile_dir, name + '.prof'))
+            if trace:
+                snapshot = tracemalloc.take_snapshot()
+                record['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+                tracemalloc.stop()
+                with open(os.path.join(self.profile_dir, name + '.tracemalloc.txt'), 'w') as f:
+                    for stat in snapshot.statistics('lineno')[:25]:
+                        f.write('{}\n'.format(stat))
+            self.records.append(record)
+
+    def total(self, field):
+        return sum(r[field] for r in self.records)
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'stages': self.records, 'wall_s': round(self.total('wall_s'), 4),
+                       'cpu_s': round(self.total('cpu_s'), 4), 'budget_mb': self.budget_mb}, f, indent=1)
+
+    def to_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.records)
+
+    def write(self, path):
+        """Write the report as CSV or JSON, by the extension of ``path``."""
+        if path.lower().endswith('.csv'):
+            self.to_csv(path)
+        else:
+            self.to_json(path)
+
+    def __str__(self):
+        lines = ['{:<10} {:>9} {:>9} {:>10} {:>10} {:>10}'.format('stage', 'wall s', 'cpu s', 'peak MB', 'rows in', 'rows out')]
+        for r in self.records:
+            lines.append('{:<10} {:9.3f} {:9.3f} {:10.1f} {:>10} {:>10}{}'.format(
+                r['stage'], r['wall_s'], r['cpu_s'], r['peak_rss_mb'],
+                '' if r['rows_in'] is None else r['rows_in'], '' if r['rows_out'] is None else r['rows_out'],
+                '  over budget' if r['over_budget'] else ''))
+        return '\n'.join(lines)
@@ -0,0 +1,119 @@
+"""Netting of cancellation lines against the purchases they reverse.
+
+A cancellation line is matched to purchase lines with the same CustomerID,
+StockCode and UnitPrice dated at or before it, oldest purchase first. Within
+one key, with ``P_j`` the quantity purchased up to cancellation ``j`` and
+``Q_j`` the quantity cancelled up to and including it, the quantity matched
+so far is
+
+    M_j = Q_j + min(0, min_{i <= j} (P_i - Q_i))
+
+(a cancellation can never take back more than was bought before it), so the
+whole matching is two sorts, binary searches and grouped cumulative sums:
+O(n log n) with no per-line Python.
+
+Dates are compared at or before rather than strictly before, because
+compact frames and the cohort stage only keep the day.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .ingest import date_column
+
+KEY = ['CustomerID', 'StockCode', 'UnitPrice']
+
+
+def _kinds(df):
+    """``(sale, cancellation)`` masks, from ``Kind`` when the frame is classified."""
+    if 'Kind' in df.columns:
+        return (df.Kind == 'sale').to_numpy(), (df.Kind == 'cancellation').to_numpy()
+    cancelled = df.Cancelled.to_numpy() if 'Cancelled' in df.columns else \
+        df.InvoiceNo.astype(str).str.startswith('C').to_numpy()
+    quantity = df.Quantity.to_numpy()
+    return ~cancelled & (quantity > 0), cancelled & (quantity < 0)
+
+
+def _within_key(values, key):
+    """Cumulative sum of ``values`` restarting at every new ``key`` (``key`` sorted)."""
+    total = np.cumsum(values)
+    first = np.r_[True, key[1:] != key[:-1]]
+    base = (total - values)[first]
+    return total - np.repeat(base, np.diff(np.r_[np.flatnonzero(first), len(key)]))
+
+
+def match(df):
+    """Matched and unmatched quantity of every line of ``df``.
+
+    Returns ``(taken, unmatched)``: for purchase lines the units taken back by
+    later cancellations, for cancellation lines the (positive) units that
+    found no earlier purchase; zero elsewhere.
+    """
+    sale, cancellation = _kinds(df)
+    lines = np.flatnonzero(sale | cancellation)
+    taken = np.zeros(len(df), dtype='int64')
+    unmatched = np.zeros(len(df), dtype='int64')
+    if not cancellation.any():
+        return taken, unmatched
+
+    sub = df.iloc[lines]
+    key = sub.groupby(KEY, sort=False, observed=True).ngroup().to_numpy()
+    dates = np.asarray(sub[date_column(df)])
+    date_rank = np.unique(dates, return_inverse=True)[1].reshape(-1)
+    # One sortable int per (key, date): the rank of the date within all dates.
+    span = int(date_rank.max()) + 1
+    order_key = key.astype('int64') * span + date_rank
+    is_cancel = cancellation[lines]
+    quantity = np.abs(sub.Quantity.to_numpy().astype('int64'))
+
+    # Purchases sorted by (key, date) with their cumulative quantity.
+    p = np.flatnonzero(~is_cancel)
+    p = p[np.argsort(order_key[p], kind='stable')]
+    p_order = order_key[p]
+    p_total = np.r_[0, np.cumsum(quantity[p])]
+
+    # Cancellations sorted the same way; P is what the key bought up to each one.
+    c = np.flatnonzero(is_cancel)
+    c = c[np.argsort(order_key[c], kind='stable')]
+    c_key = key[c]
+    start = np.searchsorted(p_order, c_key.astype('int64') * span, side='left')
+    upto = np.searchsorted(p_order, order_key[c], side='right')
+    bought = p_total[upto] - p_total[start]
+    cancelled = _within_key(quantity[c], c_key)
+    slack = pd.Series(bought - cancelled).groupby(c_key).cummin().to_numpy()
+    matched_total = cancelled + np.minimum(0, slack)
+    first = np.r_[True, c_key[1:] != c_key[:-1]]
+    matched = np.diff(np.r_[0, matched_total])
+    matched[first] = matched_total[first]
+    unmatched[lines[c]] = quantity[c] - matched
+
+    # The matched units are the oldest ones bought: each key consumes a prefix of its purchases.
+    last = np.r_[c_key[1:] != c_key[:-1], True]
+    consumed = np.zeros(int(key.max()) + 1, dtype='int64')
+    consumed[c_key[last]] = matched_total[last]
+    p_key = key[p]
+    before = _within_key(quantity[p], p_key) - quantity[p]
+    taken[lines[p]] = np.clip(consumed[p_key] - before, 0, quantity[p])
+    return taken, unmatched
+
+
+def net(df):
+    """Add ``NetQuantity`` and ``NetAmount`` to ``df`` in place.
+
+    Purchase lines lose the units their cancellations took back, matched
+    cancellation units are zeroed, and other lines keep their Quantity.
+    Returns ``(df, counts)`` where ``counts`` holds the number of
+    ``cancellations`` and of those ``unmatched`` (no unit matched) or only
+    ``partial``-ly matched.
+    """
+    _, cancellation = _kinds(df)
+    taken, unmatched = match(df)
+    quantity = df.Quantity.to_numpy().astype('int64')
+    net_quantity = np.where(cancellation, -unmatched, quantity - taken)
+    df['NetQuantity'] = net_quantity.astype(df.Quantity.dtype)
+    df['NetAmount'] = net_quantity * df.UnitPrice.to_numpy()
+    missing = unmatched[cancellation]
+    full = np.abs(quantity[cancellation]) == missing
+    counts = {'cancellations': int(cancellation.sum()), 'unmatched': int(full.sum()),
+              'partial': int(((missing > 0) & ~full).sum())}
+    return df, counts
@@ -0,0 +1,197 @@
+"""Incremental segment updates with stable cluster ids and drift metrics.
+
+A refresh of the segmentation refits the StandardScaler and KMeans from
+scratch, and KMeans may number the same clusters differently every time.
+:class:`SegmentState` keeps what a refresh needs instead: the running count,
+mean and sum of squared deviations of the log RFM values, and the centroids
+in log space with the weight of the customers each has absorbed.
+:meth:`SegmentState.partial_fit` folds a batch of customers into both in
+time proportional to the batch (one nearest-centroid pass, then a running
+mean per cluster as in MiniBatchKMeans) and keeps the cluster ids. A full
+retrain is renumbered after the previous run with :func:`align`. The
+pipeline folds in every customer of the current run, one snapshot per batch,
+since all of them need a label anyway; see :data:`DECAY` for how the
+snapshots are weighted.
+
+:func:`drift` compares two states cluster by cluster: how far the centroid
+moved, in standard deviations of the normalized values, and how the
+cluster's share of the customers changed. :func:`needs_retrain` tells when
+either goes past its limit:
+
+    previous = SegmentState.load('segments_k4.npz')
+    state = previous.copy()
+    labels = state.partial_fit(data)
+    if needs_retrain(drift(previous, state)):
+        ...
+"""
+
+import numpy as np
+import pandas as pd
+
+from .rfm import RFM_COLUMNS
+
+# Weight kept by the earlier batches when a batch is folded in. A batch is a
+# full snapshot of the customers (every run passes its whole RFM frame), so a
+# returning customer is counted again in every snapshot; the state is an
+# exponentially weighted average of the snapshots. At 0.5 the latest snapshot
+# weighs as much as all the earlier ones together, so a real shift shows in
+# the drift after one run while a single odd batch moves the centroids only
+# halfway. At 1 every snapshot counts the same, at 0 only the latest does.
+DECAY = 0.5
+
+# Retrain limits: centroid shift in standard deviations, relative change of a cluster's share.
+MAX_SHIFT = 0.25
+MAX_SIZE_CHANGE = 0.2
+
+
+class SegmentState:
+    """Scaler statistics and centroids of one k, updated batch by batch."""
+
+    def __init__(self, n, mean, m2, centroids, counts, sizes, columns=RFM_COLUMNS):
+        self.n = float(n)
+        self.mean = np.asarray(mean, dtype='float64')
+        self.m2 = np.asarray(m2, dtype='float64')
+        self.centroids = np.asarray(centroids, dtype='float64')
+        self.counts = np.asarray(counts, dtype='float64')
+        self.sizes = np.asarray(sizes, dtype='int64')
+        self.columns = list(columns)
+        self.labels_ = None
+
+    @classmethod
+    def from_fitted(cls, scaler, kmeans, labels=None):
+        """State of a StandardScaler and a KMeans fitted on the log RFM values."""
+        labels = kmeans.labels_ if labels is None else labels
+        sizes = np.bincount(labels, minlength=len(kmeans.cluster_centers_))
+        n = float(np.max(scaler.n_samples_seen_))
+        state = cls(n, scaler.mean_, scaler.var_ * n, kmeans.cluster_centers_ * scaler.scale_ + scaler.mean_,
+                    sizes, sizes, getattr(scaler, 'feature_names_in_', RFM_COLUMNS))
+        state.labels_ = np.asarray(labels)
+        return state
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['n'], f['mean'], f['m2'], f['centroids'], f['counts'], f['sizes'],
+                       [str(c) for c in f['columns']])
+
+    def save(self, path):
+        np.savez(path, n=self.n, mean=self.mean, m2=self.m2, centroids=self.centroids, counts=self.counts,
+                 sizes=self.sizes, columns=np.array(self.columns))
+
+    def copy(self):
+        return SegmentState(self.n, self.mean.copy(), self.m2.copy(), self.centroids.copy(), self.counts.copy(),
+                            self.sizes.copy(), self.columns)
+
+    @property
+    def k(self):
+        return len(self.centroids)
+
+    @property
+    def scale(self):
+        """Standard deviations of the log values; 1 for a constant column, as in StandardScaler."""
+        scale = np.sqrt(self.m2 / self.n)
+        return np.where(scale == 0, 1.0, scale)
+
+    @property
+    def cluster_centers_(self):
+        """Centroids in the normalized space of the current scaler statistics."""
+        return (self.centroids - self.mean) / self.scale
+
+    def segment_model(self):
+        """The :class:`~retail_segmentation.serving.SegmentModel` of the current state."""
+        from .serving import SegmentModel
+
+        return SegmentModel(self.mean, self.scale, self.cluster_centers_, self.columns)
+
+    def _log(self, data):
+        if hasattr(data, 'columns'):
+            data = data[self.columns].to_numpy()
+        return np.log(np.atleast_2d(np.asarray(data, dtype='float64')))
+
+    def _nearest(self, X):
+        centroids = self.cluster_centers_
+        Z = (X - self.mean) / self.scale
+        return np.argmin((centroids ** 2).sum(axis=1) - 2.0 * Z @ centroids.T, axis=1)
+
+    def predict(self, data):
+        """Cluster id of every raw (Recency, Frequency, MonetaryValue) row."""
+        return self._nearest(self._log(data))
+
+    def partial_fit(self, data, decay=DECAY):
+        """Fold a batch of raw RFM rows into the scaler statistics and the centroids.
+
+        The earlier weight is multiplied by ``decay`` first, so a batch
+        holding the whole current population (as in the pipeline) makes the
+        statistics a weighted average of the snapshots. The batch is
+        assigned to the nearest centroids, each of which moves to the weighted
+        mean of its old position and its new customers; a cluster without new
+        customers keeps its centroid. Returns the labels of the batch.
+        """
+        X = self._log(data)
+        n = self.n * decay
+        batch_mean = X.mean(axis=0)
+        delta = batch_mean - self.mean
+        total = n + len(X)
+        # Chan et al.: pooled mean and sum of squared deviations of two samples.
+        self.m2 = self.m2 * decay + ((X - batch_mean) ** 2).sum(axis=0) + delta ** 2 * n * len(X) / total
+        self.mean = self.mean + delta * len(X) / total
+        self.n = total
+
+        labels = self._nearest(X)
+        sizes = np.bincount(labels, minlength=self.k)
+        sums = np.column_stack([np.bincount(labels, weights=X[:, d], minlength=self.k) for d in range(X.shape[1])])
+        counts = self.counts * decay + sizes
+        moved = sizes > 0
+        centroids = self.centroids.copy()
+        centroids[moved] = (self.counts[moved, None] * decay * centroids[moved] + sums[moved]) / counts[moved, None]
+        self.centroids, self.counts, self.sizes, self.labels_ = centroids, counts, sizes, labels
+        return labels
+
+    def reorder(self, order):
+        """State whose cluster ``i`` is cluster ``order[i]`` of this one."""
+        state = SegmentState(self.n, self.mean, self.m2, self.centroids[order], self.counts[order],
+                             self.sizes[order], self.columns)
+        if self.labels_ is not None:
+            state.labels_ = np.argsort(order)[self.labels_]
+        return state
+
+
+def align(previous, state):
+    """Renumber the clusters of ``state`` after the nearest centroids of ``previous``.
+
+    Centroids are paired by the smallest total squared distance in the
+    normalized space of ``state``, so a retrained model keeps the cluster ids
+    the downstream mappings know. Returns ``(state, mapping)`` where
+    ``mapping[old_id]`` is the new id of a cluster.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    if previous.k != state.k:
+        raise ValueError('cannot align {} clusters with {}'.format(state.k, previous.k))
+    before = (previous.centroids - state.mean) / state.scale
+    cost = ((before[:, None, :] - state.cluster_centers_[None, :, :]) ** 2).sum(axis=2)
+    _, order = linear_sum_assignment(cost)
+    return state.reorder(order), np.argsort(order)
+
+
+def drift(previous, state):
+    """Per-cluster drift from ``previous`` to ``state`` (same cluster ids).
+
+    ``shift`` is the distance the centroid moved, in standard deviations of
+    ``state``; ``size_change`` the relative change of the cluster's share of
+    the customers (-1 when it lost all of them).
+    """
+    shift = np.sqrt(((((state.centroids - previous.centroids) / state.scale)) ** 2).sum(axis=1))
+    before = previous.sizes / max(previous.sizes.sum(), 1)
+    after = state.sizes / max(state.sizes.sum(), 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(before > 0, after / before - 1, np.where(after > 0, np.inf, 0.0))
+    report = pd.DataFrame({'shift': shift, 'previous_size': previous.sizes, 'size': state.sizes,
+                           'size_change': change})
+    report.index.name = 'cluster'
+    return report
+
+
+def needs_retrain(report, max_shift=MAX_SHIFT, max_size_change=MAX_SIZE_CHANGE):
+    """Whether any cluster of a :func:`drift` report moved or changed size beyond the limits."""
+    return bool((report['shift'] > max_shift).any() or (report.size_change.abs() > max_size_change).any())
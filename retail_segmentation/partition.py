@@ -0,0 +1,132 @@
+"""Per-Country segmentation, one partition per market, on a process pool.
+
+The cleaned transactions are sorted by Country once and the few columns RFM
+needs are saved as ``.npy`` files in a scratch directory. Workers memory-map
+those files and read only the row range of their Country, so no DataFrame is
+pickled to them; each runs RFM, scaling and KMeans for every k and sends back
+its small per-customer table. All markets share the snapshot date of the
+whole data, and the per-Country summaries are merged into one table per k
+indexed by (Country, cluster).
+"""
+
+import contextlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import rfm as rfm_engine
+from .clustering import RANDOM_STATE
+from .ingest import date_column, invoice_numbers
+from .rfm import SEGMENT_BINS, SEGMENT_LABELS, WINDOW_DAYS
+
+# Markets with fewer customers in the window are not segmented.
+MIN_CUSTOMERS = 20
+
+
+def write_columns(df, directory, amount='Amount'):
+    """Save the RFM columns of ``df`` sorted by Country; returns ``[(country, start, stop), ...]``.
+
+    String InvoiceNo values are stored as their int64 numbers; only their
+    count matters to RFM.
+    """
+    country = pd.Categorical(df.Country)
+    order = np.argsort(country.codes, kind='stable')
+    bounds = np.searchsorted(country.codes[order], np.arange(len(country.categories) + 1))
+
+    invoice_no = df.InvoiceNo.to_numpy()
+    if invoice_no.dtype.kind not in 'iu':
+        invoice_no = invoice_numbers(df.InvoiceNo)[0]
+    col = date_column(df)
+    columns = {'CustomerID': df.CustomerID.to_numpy(), col: df[col].to_numpy(),
+               'InvoiceNo': invoice_no, amount: df[amount].to_numpy()}
+    for name, values in columns.items():
+        np.save(os.path.join(directory, name + '.npy'), values[order])
+    return [(name, int(start), int(stop)) for name, start, stop in zip(country.categories, bounds[:-1], bounds[1:])
+            if stop > start]
+
+
+def _init_worker():
+    global _limits
+    from threadpoolctl import threadpool_limits
+    # One OpenMP thread per worker, the pool provides the parallelism.
+    _limits = threadpool_limits(limits=1)
+
+
+def segment(directory, names, start, stop, k_values, window_days=WINDOW_DAYS, amount='Amount', end=None,
+            snapshot_date=None, random_state=RANDOM_STATE, min_customers=MIN_CUSTOMERS, bins=SEGMENT_BINS,
+            labels=SEGMENT_LABELS, method='exact'):
+    """RFM table with one ``Cluster_k<k>`` column per k of rows ``start:stop`` of the saved columns.
+
+    The window ends on ``end`` and Recency counts from ``snapshot_date``
+    (by default the day after ``end``). ``method`` is the KMeans method of
+    :func:`~retail_segmentation.pipeline.cluster`. Returns ``(data, None)``, or
+    ``(None, reason)`` when the partition cannot be segmented: too few
+    customers, or too many ties for quartiles.
+    """
+    from .pipeline import cluster, scale
+
+    df = pd.DataFrame({name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')[start:stop]
+                       for name in names})
+    data_rfm, snapshot = rfm_engine.window(df, window_days, amount=amount, end=end)
+    data = rfm_engine.aggregate(data_rfm, snapshot if snapshot_date is None else snapshot_date)
+    if len(data) < max(min_customers, max(k_values)):
+        return None, 'too few customers ({})'.format(len(data))
+    try:
+        rfm_engine.score(data, bins=bins, labels=labels)
+    except ValueError as e:
+        return None, str(e).splitlines()[0]
+    _, data_norm = scale(data)
+    for k in k_values:
+        data['Cluster_k{}'.format(k)] = cluster(data_norm, k, random_state, method=method).labels_
+    return data, None
+
+
+def by_country(df, k_values, window_days=WINDOW_DAYS, amount='Amount', n_jobs=None, random_state=RANDOM_STATE,
+               min_customers=MIN_CUSTOMERS, directory=None, bins=SEGMENT_BINS, labels=SEGMENT_LABELS,
+               snapshot_date=None, method='exact'):
+    """Segment every Country of ``df`` separately.
+
+    Every market shares the window and the snapshot date of the whole data
+    (by default the day after its last purchase in the window, as in
+    :func:`~retail_segmentation.rfm.window`), is scored with ``bins`` and
+    ``labels`` and is clustered with the KMeans ``method``. Returns ``(data,
+    summaries, skipped)``: the per-customer RFM table of all markets with a
+    Country column, the merged summaries keyed by k, and the Countries left
+    out with their reason. The columns are written to ``directory`` (a
+    temporary one by default).
+    """
+    from .pipeline import summarize
+
+    col = date_column(df)
+    end = df[col].max()
+    if snapshot_date is None:
+        snapshot_date = rfm_engine.window(df, window_days, amount=amount)[1]
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryDirectory() if directory is None else contextlib.nullcontext(directory) as directory:
+        partitions = write_columns(df, directory, amount)
+        names = ['CustomerID', col, 'InvoiceNo', amount]
+        # Largest markets first, so the long tasks do not end up last.
+        partitions.sort(key=lambda p: p[1] - p[2])
+        args = [(directory, names, start, stop, k_values, window_days, amount, end, snapshot_date, random_state,
+                 min_customers, bins, labels, method) for _, start, stop in partitions]
+        n_jobs = min(n_jobs or os.cpu_count() or 1, len(partitions) or 1)
+        if n_jobs == 1:
+            results = [segment(*a) for a in args]
+        else:
+            with ProcessPoolExecutor(n_jobs, initializer=_init_worker) as pool:
+                results = list(pool.map(segment, *zip(*args)))
+
+    tables, skipped = {}, {}
+    for (country, _, _), (data, reason) in zip(partitions, results):
+        if data is None:
+            skipped[country] = reason
+        else:
+            tables[country] = data
+    data = pd.concat(tables, names=['Country']).reset_index(level=0) if tables else pd.DataFrame()
+    summaries = {k: pd.concat({country: summarize(t, 'Cluster_k{}'.format(k)).round(0) for country, t in tables.items()},
+                              names=['Country']) for k in k_values} if tables else {}
+    return data, summaries, skipped
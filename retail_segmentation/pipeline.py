@@ -0,0 +1,578 @@
+"""Headless pipeline stages: load -> clean -> cohort -> RFM -> scale -> cluster.
+
+Each stage is a plain function over DataFrames so the segmentation can run in
+batch workers without Colab, a display or the plotting libraries. Figures live
+in :mod:`retail_segmentation.report` and are only imported on request.
+"""
+
+import contextlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from . import basket as basket_engine
+from . import classify as classify_engine
+from . import clustering
+from . import cohort as cohort_engine
+from . import dedup as dedup_engine
+from . import netting
+from . import online
+from . import partition
+from . import sketch
+from . import stagecache
+from . import rfm as rfm_engine
+from . import serving
+from .clustering import K_RANGE, RANDOM_STATE
+from .ingest import (COLUMNS, DEFAULT_CACHE_DIR, STAGE_COLUMNS, date_column, load_compact, load_transactions,
+                     source_digest)
+from .instrument import RunReport
+from .rfm import RFM_COLUMNS, SEGMENT_BINS, SEGMENT_LABELS, WINDOW_DAYS
+
+# Peculiar StockCodes: postage, discount, manual, bank charges, ... The rule
+# table of :mod:`classify` is the one list, so the report filters the same
+# lines whether or not a frame carries the ``Kind`` column.
+CODES = list(classify_engine.RULES)
+
+K_VALUES = (3, 4, 5)
+
+
+def load(source, report=False, cache_dir=DEFAULT_CACHE_DIR, compact=False):
+    """Read the transactions; Description is only loaded for the report (dedup ignores it).
+
+    With ``compact`` the frame uses the memory-budget types of
+    :func:`~retail_segmentation.ingest.compact_types` (anonymous lines already
+    dropped, InvoiceDay instead of InvoiceDate).
+    """
+    columns = COLUMNS if report else STAGE_COLUMNS
+    if compact:
+        return load_compact(source, columns=columns, cache_dir=cache_dir)
+    return load_transactions(source, columns=columns, cache_dir=cache_dir)
+
+
+def prepare(df):
+    """Drop transactions without a CustomerID and add the line Amount.
+
+    Nothing is copied when every line has a CustomerID.
+    """
+    if df.CustomerID.hasnans:
+        df = df.dropna(subset=['CustomerID'])
+    df = df.copy(deep=False)
+    df['Amount'] = df.UnitPrice * df.Quantity
+    return df
+
+
+def dedup(df, index=None):
+    """Drop exact duplicate transaction lines; the frame is only copied when some are found.
+
+    Lines are compared by a 64-bit fingerprint. Given a
+    :class:`~retail_segmentation.dedup.FingerprintIndex` of earlier batches,
+    lines already seen there are dropped too and the index is updated. See
+    :mod:`retail_segmentation.dedup`.
+    """
+    return dedup_engine.drop_duplicates(df, index)[0]
+
+
+def clean(df):
+    """Drop anonymous and duplicated transactions and add the line Amount."""
+    return dedup(prepare(df))
+
+
+def classify(df, rules=classify_engine.RULES):
+    """Tag every line as sale, cancellation, postage, fee, discount or adjustment.
+
+    Adds the compact ``Kind`` (categorical) and ``Cancelled`` (bool) columns to
+    ``df`` in place, for the report and RFM filters. ``rules`` maps the
+    non-product StockCodes to their kind. See :mod:`retail_segmentation.classify`.
+    """
+    return classify_engine.classify(df, rules)
+
+
+def net(df):
+    """Match cancellation lines to the earlier purchases they reverse.
+
+    Adds ``NetQuantity`` and ``NetAmount`` to ``df`` in place; returns
+    ``(df, counts)`` with the number of cancellations and of unmatched and
+    partially matched ones. See :mod:`retail_segmentation.netting`.
+    """
+    return netting.net(df)
+
+
+def cohort(df):
+    """Time cohorts by calendar month of first purchase.
+
+    Truncates InvoiceDate to the day and adds CohortMonth and CohortIndex (exact
+    calendar months since the CohortMonth) to ``df`` in place, so the
+    transaction table is not copied. Compact frames (with InvoiceDay) are left
+    untouched. Returns ``(df, cohort_counts, retention)`` with ``retention`` in
+    percent. See :mod:`retail_segmentation.cohort`.
+    """
+    if 'InvoiceDay' in df.columns:
+        cohort_counts, retention = cohort_engine.compute(df)
+        return df, cohort_counts, retention
+
+    df['InvoiceDate'] = df.InvoiceDate.dt.normalize()
+    cohort_month, cohort_index = cohort_engine.assign(df.CustomerID, df.InvoiceDate)
+    df['CohortMonth'] = cohort_engine.month_start(cohort_month)
+    df['CohortIndex'] = cohort_index
+
+    cohort_counts = cohort_engine.counts(df.CustomerID, cohort_month, cohort_index)
+    return df, cohort_counts, cohort_engine.retention(cohort_counts)
+
+
+def update_cohort(df, state):
+    """:func:`cohort` of the whole history from the batch ``df`` and the cohort state of the earlier ones.
+
+    ``state`` is a :class:`~retail_segmentation.cohort.CohortState`; the
+    batch is folded into it in place, in time proportional to the batch. The
+    CohortMonth and CohortIndex added to ``df`` count from each customer's
+    first month in the whole history. Returns ``(df, cohort_counts,
+    retention)``.
+    """
+    col = date_column(df)
+    state.update(df.CustomerID, df[col])
+    if col != 'InvoiceDay':
+        df['InvoiceDate'] = df.InvoiceDate.dt.normalize()
+        cohort_month = state.cohort_month[np.asarray(df.CustomerID, dtype='int64')]
+        df['CohortMonth'] = cohort_engine.month_start(cohort_month)
+        df['CohortIndex'] = (cohort_engine.month_number(df.InvoiceDate) - cohort_month).astype('int16')
+    return df, state.cohort_counts(), state.retention()
+
+
+def rfm(cohort_data, window_days=WINDOW_DAYS, bins=SEGMENT_BINS, labels=SEGMENT_LABELS, kinds=None,
+        amount='Amount', quantiles='exact'):
+    """Per-customer Recency, Frequency and MonetaryValue with quartile scores.
+
+    Only purchases (``amount`` > 0, restricted to the given ``kinds`` of a
+    classified frame) in the last ``window_days`` days are counted and the
+    snapshot date is the day after the last one in the data. Pass
+    ``amount='NetAmount'`` after :func:`net` to count purchases net of their
+    cancellations. The R/F/M quartiles are exact (``quantiles='exact'``) or
+    cut at the points of a mergeable quantile sketch (``'sketch'``, see
+    :mod:`retail_segmentation.sketch`). See :mod:`retail_segmentation.rfm`.
+    """
+    if quantiles == 'exact':
+        return rfm_engine.compute(cohort_data, window_days=window_days, bins=bins, labels=labels, kinds=kinds,
+                                  amount=amount)
+    return _score(rfm_engine.aggregate(*rfm_engine.window(cohort_data, window_days, kinds, amount)), bins, labels,
+                  quantiles)
+
+
+def _score(data, bins, labels, quantiles):
+    if quantiles == 'exact':
+        return rfm_engine.score(data, bins=bins, labels=labels)
+    if quantiles != 'sketch':
+        raise ValueError("quantiles must be 'exact' or 'sketch', not {!r}".format(quantiles))
+    return rfm_engine.score(data, bins=bins, labels=labels, cut_points=sketch.cut_points(sketch.rfm_sketches(data)))
+
+
+def update_rfm(cohort_data, state, bins=SEGMENT_BINS, labels=SEGMENT_LABELS, amount='Amount', quantiles='exact'):
+    """Fold the purchases of ``cohort_data`` into an RFM state and read every customer's RFM frame from it.
+
+    ``state`` is a :class:`~retail_segmentation.rfm.RFMState` holding the
+    earlier batches; it is updated in place, so ``cohort_data`` only needs
+    the new lines and the earlier ones are not aggregated again. The frame
+    is scored as in :func:`rfm`.
+    """
+    col = date_column(cohort_data)
+    state.update(pd.DataFrame({'CustomerID': cohort_data.CustomerID.to_numpy(), col: cohort_data[col].to_numpy(),
+                               'Amount': cohort_data[amount].to_numpy()}))
+    return _score(state.frame(scored=False), bins, labels, quantiles)
+
+
+def rolling_rfm(cohort_data, snapshots=24, window_days=WINDOW_DAYS, kinds=None, amount='Amount', segments=None,
+                cut_points=None):
+    """Recency, Frequency, MonetaryValue and scores of every customer as of each snapshot date.
+
+    ``snapshots`` is a list of snapshot dates, or the number of month-ends to
+    go back from the last one in the data (see
+    :func:`~retail_segmentation.rfm.month_snapshots`). Returns one long table
+    with a ``snapshot`` column, computed in a single sorted pass (see
+    :func:`retail_segmentation.rfm.rolling`). Every snapshot is scored on its
+    own quartiles, or on fixed ``cut_points`` (e.g.
+    :func:`retail_segmentation.rfm.cut_points` of the latest RFM frame) so
+    the codes compare across snapshots. ``segments`` maps k to a model
+    that predicts clusters from raw RFM rows, e.g. a
+    :class:`~retail_segmentation.serving.SegmentModel`; each adds a
+    ``Cluster_k<k>`` column.
+    """
+    if isinstance(snapshots, int):
+        snapshots = rfm_engine.month_snapshots(cohort_data[date_column(cohort_data)], snapshots)
+    table = rfm_engine.rolling(cohort_data, snapshots, window_days, kinds, amount, cut_points=cut_points)
+    for k, model in (segments or {}).items():
+        table['Cluster_k{}'.format(k)] = model.predict(table[RFM_COLUMNS])
+    return table
+
+
+def summarize(data, by):
+    """Mean Recency/Frequency/MonetaryValue and group size per ``by``."""
+    return data.groupby(by).agg({'Recency': 'mean',
+                                 'Frequency': 'mean',
+                                 'MonetaryValue': ['mean', 'count']})
+
+
+def scale(data, memmap=False):
+    """Unskew with a log transform and standardize.
+
+    Returns ``(scaler, data_norm)``; ``data_norm`` keeps the index of ``data``.
+    With ``memmap`` the values are normalized chunk by chunk into a
+    memory-mapped ``.npy`` in the temporary directory, and ``data_norm`` is a
+    read-only view of it (see
+    :func:`retail_segmentation.clustering.scale_to_memmap`).
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    if memmap:
+        fd, path = tempfile.mkstemp(prefix='data_norm-', suffix='.npy')
+        os.close(fd)
+        scaler, X = clustering.scale_to_memmap(data, path)
+        # The mapping keeps the data until it is closed; where an open file
+        # cannot be removed (Windows) it is left in the temporary directory.
+        with contextlib.suppress(OSError):
+            os.remove(path)
+        return scaler, pd.DataFrame(X, index=data.index, columns=RFM_COLUMNS, copy=False)
+
+    rfm_data = data[RFM_COLUMNS]
+    data_log = np.log(rfm_data)
+    scaler = StandardScaler()
+    scaler.fit(data_log)
+    data_norm = pd.DataFrame(data=scaler.transform(data_log), index=rfm_data.index, columns=rfm_data.columns)
+    return scaler, data_norm
+
+
+def elbow(data_norm, k_range=K_RANGE, random_state=RANDOM_STATE, n_jobs=None, cache=None, score_sample=None):
+    """Elbow sweep: inertia (and optionally silhouette/Davies-Bouldin) for every k.
+
+    The fits run on a pool and land in ``cache``, where :func:`cluster` finds
+    them. See :func:`retail_segmentation.clustering.sweep`.
+    """
+    return clustering.sweep(data_norm, k_range, random_state=random_state, n_jobs=n_jobs,
+                            cache=cache, score_sample=score_sample)
+
+
+def cluster(data_norm, k, random_state=RANDOM_STATE, cache=None, method='exact'):
+    """Fit KMeans with ``k`` clusters on the normalized RFM data, or reuse a cached fit.
+
+    ``method='coreset'`` or ``'minibatch'`` fits the centroids on a weighted
+    coreset or with mini-batch updates and labels the customers in chunks;
+    see :func:`retail_segmentation.clustering.fit_streamed`.
+    """
+    if method != 'exact':
+        return clustering.fit_streamed(np.asarray(data_norm, dtype='float64'), k, method, random_state)
+    if cache is None:
+        return clustering.fit_kmeans(data_norm, k, random_state)
+    return cache.fit(np.ascontiguousarray(data_norm, dtype='float64'), k, random_state)
+
+
+def refresh(data, data_norm, scaler, k, previous=None, random_state=RANDOM_STATE, cache=None, method='exact',
+            decay=online.DECAY, max_shift=online.MAX_SHIFT, max_size_change=online.MAX_SIZE_CHANGE):
+    """Update the ``previous`` run's segments of ``k`` clusters with the customers of ``data``.
+
+    ``data`` is the run's whole RFM frame, one snapshot of every customer:
+    they all need a label, and the update is one nearest-centroid pass over
+    them. The previous scaler statistics and centroids are updated with it
+    (weighing the earlier snapshots by ``decay``) in place of a refit,
+    keeping the cluster ids. KMeans is only refitted (as in
+    :func:`cluster`) when there is no previous state or the drift goes past
+    ``max_shift`` or ``max_size_change``; the refitted clusters are then
+    renumbered after the previous centroids. Returns ``(state, drift,
+    retrained)``: the new :class:`~retail_segmentation.online.SegmentState`
+    with the customers' ``labels_``, the per-cluster drift from the previous
+    state (None without one) and whether KMeans was refitted. See
+    :mod:`retail_segmentation.online`.
+    """
+    if previous is not None:
+        state = previous.copy()
+        state.partial_fit(data, decay)
+        report = online.drift(previous, state)
+        if not online.needs_retrain(report, max_shift, max_size_change):
+            return state, report, False
+    model = cluster(data_norm, k, random_state, cache, method)
+    state = online.SegmentState.from_fitted(scaler, model)
+    if previous is None:
+        return state, None, True
+    state, _ = online.align(previous, state)
+    return state, online.drift(previous, state), True
+
+
+def basket(df, data, data_norm, n_components=basket_engine.N_COMPONENTS, weight=1.0, value='Quantity'):
+    """Customer x StockCode matrix of ``data``'s customers and the clustering features with its embedding.
+
+    Returns ``(features, X, stock_codes, embedding)``: ``data_norm`` with
+    ``n_components`` TF-IDF/SVD basket columns carrying ``weight`` times its
+    variance, the sparse CSR matrix of summed ``value`` (rows in the order of
+    ``data``), its StockCodes and the raw embedding. See
+    :mod:`retail_segmentation.basket`.
+    """
+    X, _, stock_codes = basket_engine.matrix(df, customers=data.CustomerID.to_numpy(), value=value)
+    embedding, _ = basket_engine.embed(X, n_components)
+    return basket_engine.combine(data_norm, embedding, weight), X, stock_codes, embedding
+
+
+def by_country(df, k_values=K_VALUES, window_days=WINDOW_DAYS, amount='Amount', n_jobs=None, bins=SEGMENT_BINS,
+               labels=SEGMENT_LABELS, method='exact'):
+    """RFM, scaling and KMeans for every Country separately, on a process pool.
+
+    Every market is measured against the snapshot date :func:`rfm` uses for
+    the whole data, scored with the same ``bins`` and ``labels`` and
+    clustered with the same ``method`` as :func:`cluster`. Returns ``(data,
+    summaries, skipped)``; see :func:`retail_segmentation.partition.by_country`.
+    """
+    return partition.by_country(df, k_values, window_days=window_days, amount=amount, n_jobs=n_jobs, bins=bins,
+                                labels=labels, method=method)
+
+
+def _stage_keys(source, cache_dir, report, compact, net_cancellations, window_days, amount, quantiles, bins, labels):
+    """Keys of the cached stage results; see :mod:`retail_segmentation.stagecache`.
+
+    The cohort key covers everything up to the cohort stage (source, columns,
+    dtypes, classify rules, netting). The normalized matrix only depends on
+    the RFM values, not on how they are scored, so it is keyed on ``values``.
+    """
+    keys = {'cohort': stagecache.key('cohort', source_digest(source, cache_dir), report, compact, net_cancellations,
+                                     classify_engine.RULES)}
+    keys['values'] = stagecache.key('values', keys['cohort'], window_days, amount)
+    keys['rfm'] = stagecache.key('rfm', keys['values'], quantiles, list(bins), list(labels))
+    return keys
+
+
+def run(source, k_values=K_VALUES, window_days=WINDOW_DAYS, report=False, with_elbow=False,
+        cache_dir=DEFAULT_CACHE_DIR, n_jobs=None, score_sample=None, model_dir=None, run_report=None,
+        compact=False, net_cancellations=False, quantiles='exact', countries=False, kmeans='exact', state_dir=None,
+        bins=SEGMENT_BINS, labels=SEGMENT_LABELS, stage_cache_dir=None, stage_cache_mb=stagecache.MAX_MB,
+        snapshots=None, basket_components=None, basket_weight=1.0, rfm_state=None, cohort_state=None,
+        dedup_index=None):
+    """Run every stage and return the intermediate results as a dict.
+
+    Keys: ``transactions``, ``cohort_counts``, ``retention``, ``rfm``,
+    ``scaler``, ``data_norm``, ``models`` and ``summaries`` (both keyed by k),
+    ``sweep``/``sse`` when ``with_elbow`` is set, and ``run_report``, the
+    :class:`~retail_segmentation.instrument.RunReport` the stages were measured
+    in (a new one unless given). ``rfm`` is indexed by CustomerID and carries
+    one ``Cluster_k<k>`` column per fitted model. Fitted models are cached in
+    ``model_dir`` when given. ``compact`` runs on the compact dtypes of the
+    memory-budget mode; give ``run_report`` a budget to check peak RSS. With
+    ``net_cancellations`` the RFM values count purchases net of the
+    cancellations matched to them (see :func:`net`). ``quantiles``, ``bins``
+    and ``labels`` select how the R/F/M values are scored (see :func:`rfm`).
+    ``countries`` also segments every Country separately (see
+    :func:`by_country`), adding ``country_rfm``, ``country_summaries`` and
+    ``country_skipped``. ``kmeans`` is the clustering method of
+    :func:`cluster`; in the memory-budget mode (``compact``) the streamed
+    methods read ``data_norm`` from a memory map (see :func:`scale`). With
+    ``state_dir`` the segments of every k are updated from the states of the
+    previous run kept there (``segments_k<k>.npz``, see
+    :func:`refresh`) and KMeans is only refitted on drift; ``segment_states``,
+    ``drift`` and ``retrained`` are added, keyed by k, and ``models`` holds the
+    states. ``snapshots`` (month-ends or dates, see :func:`rolling_rfm`) adds
+    ``snapshots``, the long table of every customer's RFM values, scores and
+    clusters of the fitted models as of each snapshot; all snapshots are
+    scored on the quartiles of the ``rfm`` frame, so the codes compare over
+    time. With ``basket_components`` KMeans clusters on ``data_norm`` plus
+    that many columns of the customers' basket embedding (see :func:`basket`),
+    weighted by ``basket_weight``; ``basket``, ``stock_codes`` and
+    ``features`` (the clustered matrix) are added.
+
+    ``rfm_state`` is the path of an :class:`~retail_segmentation.rfm.RFMState`
+    (created when missing): ``source`` is then the next batch of
+    transactions, folded into the state and saved back (see
+    :func:`update_rfm`), and ``rfm`` covers every customer of the state's
+    window, not only those of the batch. In the same way ``cohort_state`` is
+    the path of a :class:`~retail_segmentation.cohort.CohortState` the batch
+    is folded into (see :func:`update_cohort`); ``cohort_counts`` and
+    ``retention`` then cover the whole history. ``dedup_index`` is the path
+    of a :class:`~retail_segmentation.dedup.FingerprintIndex` of the lines
+    of the earlier batches: lines already seen there are dropped as
+    duplicates (counted in the run report) and the index is saved with the
+    kept ones.
+
+    With ``stage_cache_dir`` the stage results are kept in a
+    :class:`~retail_segmentation.stagecache.StageCache` of at most
+    ``stage_cache_mb`` and every stage whose inputs and parameters are
+    unchanged is read from there instead (marked ``cached`` in the run
+    report). When everything up to the normalized matrix is cached and
+    no other option needs the transactions, they are not
+    read at all and ``transactions`` is None.
+    """
+    if basket_components and state_dir is not None:
+        raise ValueError('the segment states of state_dir hold RFM centroids only, not basket_components')
+    if (rfm_state is not None or cohort_state is not None or dedup_index is not None) and stage_cache_dir:
+        raise ValueError('the stage cache is keyed on the source only and cannot be used with rfm_state, '
+                         'cohort_state or dedup_index')
+    run_report = run_report if run_report is not None else RunReport()
+    stage = run_report.stage
+    amount = 'NetAmount' if net_cancellations else 'Amount'
+    stages = stagecache.StageCache(stage_cache_dir, stage_cache_mb) if stage_cache_dir else None
+    keys = {}
+    if stages is not None:
+        keys = _stage_keys(source, cache_dir, report, compact, net_cancellations, window_days, amount, quantiles,
+                           bins, labels)
+
+    if stages is None or ('cohort', keys['cohort']) not in stages:
+        with stage('load') as s:
+            df = load(source, report=report, cache_dir=cache_dir, compact=compact)
+            s['rows_out'] = len(df)
+        with stage('prep', len(df)) as s:
+            df = prepare(df)
+            s['rows_out'] = len(df)
+        with stage('dedup', len(df)) as s:
+            index = None
+            if dedup_index is not None:
+                index = dedup_engine.FingerprintIndex.load(dedup_index) if os.path.exists(dedup_index) else \
+                    dedup_engine.FingerprintIndex()
+            df, (within, across) = dedup_engine.drop_duplicates(df, index)
+            if index is not None:
+                index.save(dedup_index)
+            s['duplicates'] = within + across
+            s['rows_out'] = len(df)
+        with stage('classify', len(df)) as s:
+            df = classify(df)
+            s['rows_out'] = len(df)
+        if net_cancellations:
+            with stage('net', len(df)) as s:
+                df, counts = net(df)
+                s['rows_out'] = len(df)
+                s['unmatched'] = counts['unmatched']
+        with stage('cohort', len(df)) as s:
+            if cohort_state is not None:
+                state = cohort_engine.CohortState.load(cohort_state) if os.path.exists(cohort_state) else \
+                    cohort_engine.CohortState()
+                cohort_data, cohort_counts, retention = update_cohort(df, state)
+                state.save(cohort_state)
+            else:
+                cohort_data, cohort_counts, retention = cohort(df)
+            s['rows_out'] = len(cohort_counts)
+            if stages is not None:
+                stages.put('cohort', keys['cohort'], {'transactions': cohort_data, 'cohort_counts': cohort_counts,
+                                                      'retention': retention})
+    else:
+        with stage('cohort') as s:
+            downstream = ('rfm', keys['rfm']) in stages and ('normalize', keys['values']) in stages
+            need_rows = report or countries or snapshots or basket_components
+            names = ['cohort_counts', 'retention'] if downstream and not need_rows else None
+            cached = stages.get('cohort', keys['cohort'], names)
+            df = cohort_data = cached.get('transactions')
+            cohort_counts, retention = cached['cohort_counts'], cached['retention']
+            s['rows_out'] = len(cohort_counts)
+            s['cached'] = True
+
+    with stage('rfm', None if cohort_data is None else len(cohort_data)) as s:
+        cached = stages.get('rfm', keys['rfm']) if stages is not None else None
+        if rfm_state is not None:
+            state = rfm_engine.RFMState.load(rfm_state) if os.path.exists(rfm_state) else \
+                rfm_engine.RFMState(window_days)
+            if state.window_days != window_days:
+                raise ValueError('{} holds a {}-day window, not {} days'.format(
+                    rfm_state, state.window_days, window_days))
+            data = update_rfm(cohort_data, state, bins, labels, amount, quantiles)
+            state.save(rfm_state)
+        elif cached is None:
+            data = rfm(cohort_data, window_days=window_days, bins=bins, labels=labels, amount=amount,
+                       quantiles=quantiles)
+            if stages is not None:
+                stages.put('rfm', keys['rfm'], {'rfm': data})
+        else:
+            data = cached['rfm']
+            s['cached'] = True
+        s['rows_out'] = len(data)
+    with stage('normalize', len(data)) as s:
+        cached = stages.get('normalize', keys['values']) if stages is not None else None
+        if cached is None:
+            scaler, data_norm = scale(data, memmap=compact and kmeans != 'exact')
+            if stages is not None:
+                stages.put('normalize', keys['values'], {'scaler': scaler, 'data_norm': data_norm})
+        else:
+            scaler, data_norm = cached['scaler'], cached['data_norm']
+            s['cached'] = True
+        s['rows_out'] = len(data_norm)
+
+    result = {}
+    features, features_key = data_norm, keys.get('values')
+    if basket_components:
+        with stage('basket', len(df)) as s:
+            features, result['basket'], result['stock_codes'], _ = basket(df, data, data_norm, basket_components,
+                                                                          basket_weight)
+            result['features'] = features
+            features_key = stagecache.key('basket', keys.get('cohort'), features_key, basket_components, basket_weight)
+            s['rows_out'] = result['basket'].nnz
+
+    cache = clustering.ModelCache(model_dir)
+    if with_elbow:
+        with stage('elbow', len(features)) as s:
+            sweep_key = stagecache.key('elbow', features_key, list(K_RANGE), RANDOM_STATE, score_sample)
+            cached = stages.get('elbow', sweep_key) if stages is not None else None
+            if cached is None:
+                result['sweep'] = elbow(features, n_jobs=n_jobs, cache=cache, score_sample=score_sample)
+                if stages is not None:
+                    stages.put('elbow', sweep_key, {'sweep': result['sweep']})
+            else:
+                result['sweep'] = cached['sweep']
+                s['cached'] = True
+            result['sse'] = result['sweep'].inertia.tolist()
+            s['rows_out'] = len(result['sweep'])
+
+    models, summaries = {}, {}
+    with stage('cluster', len(features)) as s:
+        if state_dir is not None:
+            os.makedirs(state_dir, exist_ok=True)
+            result.update({'segment_states': {}, 'drift': {}, 'retrained': {}})
+        for k in k_values:
+            if state_dir is not None:
+                path = os.path.join(state_dir, 'segments_k{}.npz'.format(k))
+                previous = online.SegmentState.load(path) if os.path.exists(path) else None
+                state, result['drift'][k], result['retrained'][k] = refresh(data, data_norm, scaler, k, previous,
+                                                                            cache=cache, method=kmeans)
+                state.save(path)
+                models[k] = result['segment_states'][k] = state
+            elif stages is not None:
+                model_key = stagecache.key('cluster', features_key, k, RANDOM_STATE, kmeans)
+                cached = stages.get('cluster', model_key)
+                s['cached'] = s.get('cached', True) and cached is not None
+                if cached is None:
+                    models[k] = stages.put('cluster', model_key, {'model': cluster(features, k, cache=cache,
+                                                                                   method=kmeans)})['model']
+                else:
+                    models[k] = cached['model']
+            else:
+                models[k] = cluster(features, k, cache=cache, method=kmeans)
+            data['Cluster_k{}'.format(k)] = models[k].labels_
+            summaries[k] = summarize(data, 'Cluster_k{}'.format(k)).round(0)
+        s['rows_out'] = len(data)
+        if state_dir is not None:
+            s['retrained'] = sum(result['retrained'].values())
+
+    if countries:
+        with stage('countries', len(df)) as s:
+            country_key = stagecache.key('countries', keys.get('cohort'), list(k_values), window_days, amount,
+                                         list(bins), list(labels), kmeans)
+            cached = stages.get('countries', country_key) if stages is not None else None
+            if cached is None:
+                country = dict(zip(['country_rfm', 'country_summaries', 'country_skipped'],
+                                   by_country(df, k_values, window_days, amount, n_jobs, bins, labels, kmeans)))
+                if stages is not None:
+                    stages.put('countries', country_key, country)
+            else:
+                country = cached
+                s['cached'] = True
+            result.update(country)
+            s['rows_out'] = len(result['country_rfm'])
+
+    if snapshots:
+        with stage('snapshots', len(df)) as s:
+            # Basket clusters need the basket of every snapshot, which is not rebuilt here.
+            segments = {} if basket_components else {
+                k: model if state_dir is not None else serving.SegmentModel.from_fitted(scaler, model)
+                for k, model in models.items()}
+            result['snapshots'] = rolling_rfm(df, snapshots, window_days, amount=amount, segments=segments,
+                                              cut_points=rfm_engine.cut_points(data))
+            s['rows_out'] = len(result['snapshots'])
+
+    data.index = data['CustomerID'].astype(int)
+    data_norm.index = data.index
+    if 'features' in result:
+        result['features'].index = data.index
+    result.update({'transactions': df, 'cohort_counts': cohort_counts, 'retention': retention,
+                   'rfm': data, 'scaler': scaler, 'data_norm': data_norm,
+                   'models': models, 'summaries': summaries, 'run_report': run_report})
+    return result
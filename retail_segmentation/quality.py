@@ -0,0 +1,192 @@
+"""Single-pass data-quality profile of the transaction table.
+
+Each column is reduced to the counts of its distinct values with one hashed
+``value_counts`` per chunk; null counts, distinct counts, min/max, top values
+and the ``describe()`` statistics (exact quartiles included) all follow from
+those counts, and chunk profiles merge by adding them. The profile doubles as a
+validation gate before a nightly run:
+
+    python -m retail_segmentation.quality Online_Retail.xlsx --check
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .ingest import COLUMNS, DEFAULT_CACHE_DIR, build_cache, load_transactions, normalize_types, pq
+
+# Largest share of nulls each column may have before the data is rejected;
+# about 25% of the Online Retail lines are anonymous.
+MAX_NULL_SHARE = {'CustomerID': 0.35, 'Description': 0.01}
+
+PERCENTILES = [0.25, 0.5, 0.75]
+
+
+class Profile:
+    """Distinct-value counts of every column, merged chunk by chunk."""
+
+    def __init__(self):
+        self.rows = 0
+        self.dtypes = {}
+        self.nulls = {}
+        self.counts = {}
+
+    def update(self, chunk):
+        """Fold a chunk of rows into the profile."""
+        for col in chunk.columns:
+            values = chunk[col]
+            counts = values.value_counts(sort=False)
+            counts = counts[counts > 0]
+            self.dtypes.setdefault(col, values.dtype)
+            self.nulls[col] = self.nulls.get(col, 0) + len(values) - int(counts.sum())
+            self.counts[col] = counts if col not in self.counts else self.counts[col].add(counts, fill_value=0)
+        self.rows += len(chunk)
+        return self
+
+    def _sorted(self, col):
+        """Sorted distinct values of ``col`` with their counts, or None when they do not compare."""
+        counts = self.counts[col]
+        try:
+            return counts.sort_index()
+        except TypeError:
+            return None
+
+    def top(self, col, n=5):
+        """The ``n`` most frequent values of ``col``, as from ``value_counts()``."""
+        return self.counts[col].astype('int64').sort_values(ascending=False, kind='stable').head(n)
+
+    def summary(self):
+        """Data type, null values and their share, distinct values, min, max and top value of every column.
+
+        The first three rows are the missing-value table of the notebook.
+        """
+        table = {}
+        for col, counts in self.counts.items():
+            ordered = self._sorted(col)
+            top = self.top(col, 1)
+            table[col] = {
+                'Data Type': self.dtypes[col],
+                'Null Values': self.nulls[col],
+                '%age of Null Values': round(self.nulls[col] * 100 / self.rows, 2) if self.rows else 0.0,
+                'Distinct': len(counts),
+                'Min': ordered.index[0] if ordered is not None and len(ordered) else None,
+                'Max': ordered.index[-1] if ordered is not None and len(ordered) else None,
+                'Top': top.index[0] if len(top) else None,
+                'Top Frequency': int(top.iloc[0]) if len(top) else 0,
+            }
+        return pd.DataFrame(table)
+
+    def describe(self, percentiles=PERCENTILES):
+        """``df.describe().T`` of the numeric columns, computed from the value counts."""
+        rows = {}
+        for col in self.counts:
+            if not pd.api.types.is_numeric_dtype(self.dtypes[col]) or pd.api.types.is_bool_dtype(self.dtypes[col]):
+                continue
+            counts = self._sorted(col)
+            values = counts.index.to_numpy(dtype='float64')
+            weights = counts.to_numpy(dtype='float64')
+            n = weights.sum()
+            if not n:
+                continue
+            mean = (values * weights).sum() / n
+            std = np.sqrt((weights * (values - mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan
+            row = {'count': n, 'mean': mean, 'std': std, 'min': values[0]}
+            cumulative = np.cumsum(weights)
+            for q in percentiles:
+                # Linear interpolation between the ranks around (n - 1) * q, as pandas does.
+                h = (n - 1) * q
+                lo, hi = np.searchsorted(cumulative, [np.floor(h) + 1, np.ceil(h) + 1])
+                row['{:g}%'.format(q * 100)] = values[lo] + (h - np.floor(h)) * (values[hi] - values[lo])
+            row['max'] = values[-1]
+            rows[col] = row
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def profile(chunks):
+    """:class:`Profile` of a DataFrame or of an iterable of DataFrame chunks."""
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    result = Profile()
+    for chunk in chunks:
+        result.update(chunk)
+    return result
+
+
+def read_chunks(source, columns=None, chunk_rows=1000000, cache_dir=DEFAULT_CACHE_DIR):
+    """Chunks of the transactions in ``source``, read without holding the whole table.
+
+    Workbooks go through the Parquet cache of :mod:`retail_segmentation.ingest`.
+    """
+    columns = columns or COLUMNS
+    ext = os.path.splitext(source)[1].lower()
+    if ext == '.csv':
+        for chunk in pd.read_csv(source, chunksize=chunk_rows, dtype={'InvoiceNo': str, 'StockCode': str}):
+            yield normalize_types(chunk)[columns]
+        return
+    if pq is None:
+        yield load_transactions(source, columns, cache_dir)
+        return
+    path = source if ext == '.parquet' else build_cache(source, cache_dir)
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+def problems(result, columns=COLUMNS, max_null_share=MAX_NULL_SHARE):
+    """Reasons to reject the profiled data; empty when it can be run.
+
+    Every column in ``columns`` must be present, the table must not be empty,
+    and no column may have a larger share of nulls than ``max_null_share``
+    allows (none by default).
+    """
+    found = []
+    if not result.rows:
+        found.append('no rows')
+    for col in columns:
+        if col not in result.counts:
+            found.append('missing column {}'.format(col))
+            continue
+        share = result.nulls[col] / result.rows if result.rows else 0.0
+        if share > max_null_share.get(col, 0.0):
+            found.append('{} has {:.2%} null values (at most {:.2%} allowed)'.format(
+                col, share, max_null_share.get(col, 0.0)))
+    return found
+
+
+def check(result, columns=COLUMNS, max_null_share=MAX_NULL_SHARE):
+    """Raise ValueError listing the :func:`problems` of the profiled data, if any."""
+    found = problems(result, columns, max_null_share)
+    if found:
+        raise ValueError('data-quality check failed: ' + '; '.join(found))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='retail_segmentation.quality', description='Profile the Online Retail transactions.')
+    parser.add_argument('source', help='Online_Retail.xlsx, a CSV export or a Parquet file')
+    parser.add_argument('--columns', nargs='+', default=None, help='columns to profile (default: all)')
+    parser.add_argument('--chunk-rows', type=int, default=1000000)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('-o', '--output', metavar='PATH', help='write the summary table as CSV')
+    parser.add_argument('--check', action='store_true', help='exit with status 1 when the data fails the checks')
+    args = parser.parse_args(argv)
+
+    result = profile(read_chunks(args.source, args.columns, args.chunk_rows, args.cache_dir))
+    summary = result.summary()
+    if args.output:
+        summary.to_csv(args.output)
+    print(summary)
+    print()
+    print(result.describe())
+    if args.check:
+        found = problems(result, args.columns or COLUMNS)
+        for problem in found:
+            print('FAILED: {}'.format(problem), file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
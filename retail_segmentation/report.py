@@ -0,0 +1,396 @@
+"""Figures from the exploratory analysis, rendered headless to PNG and HTML files.
+
+Plotting the raw frames takes longer than the analysis on large inputs:
+seaborn counts every transaction line again and bootstraps confidence
+intervals over every customer x feature of the snake plots. :func:`aggregate`
+reduces a run to the small tables the figures show instead (top Country
+counts, histograms, per-cluster feature means, the retention matrix, ...),
+and the figures are drawn from those on a process pool. The aggregates are
+pickled next to the figures, so the report can be redrawn without the run:
+
+    python -m retail_segmentation.report output/figures/aggregates.pkl --format png html
+
+matplotlib and seaborn are imported on first use, so scoring-only runs never
+pay for them.
+"""
+
+import argparse
+import functools
+import html
+import io
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .pipeline import CODES, RFM_COLUMNS
+
+AGGREGATES = 'aggregates.pkl'
+
+AMOUNT_BINS = [-1, 50, 100, 200, 500, 1000, 5000, np.inf]
+AMOUNT_NAMES = ['<50', '50-100', '100-200', '200-500', '500-1000', '1000-5000', '5000+']
+
+# numpy's 'auto' rule gives thousands of bins on the long-tailed columns.
+MAX_BINS = 200
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+
+def invoice_sizes(df):
+    """Number of lines per invoice, flagged cancelled when InvoiceNo starts with 'C'.
+
+    Compact frames carry the flag in their ``Cancelled`` column.
+    """
+    if 'Cancelled' in df.columns:
+        temp = df.groupby(['InvoiceNo', 'Cancelled'], as_index=False).agg({'StockCode': 'count'})
+        cancelled = temp.pop('Cancelled').to_numpy()
+    else:
+        temp = df.groupby('InvoiceNo', as_index=False).agg({'StockCode': 'count'})
+        cancelled = temp.InvoiceNo.astype(str).str.startswith('C').to_numpy()
+    temp.columns = ['InvoiceNo', 'Total_Orders']
+    temp['check'] = np.where(cancelled, 'Cancelled', 'Not Cancelled')
+    return temp.sort_values(by='Total_Orders', ascending=False)
+
+
+def sales(df, codes=CODES):
+    """Mask of the product sale lines.
+
+    Classified frames are filtered on their ``Kind`` column (see
+    :mod:`retail_segmentation.classify`); otherwise lines with a positive
+    Quantity outside the peculiar ``codes`` count as sales.
+    """
+    if 'Kind' in df.columns:
+        return (df.Kind == 'sale').to_numpy()
+    return ((df.Quantity > 0) & ~df.StockCode.isin(codes)).to_numpy()
+
+
+def invoice_amounts(df, codes=CODES):
+    """Quantity and Amount per purchase invoice, excluding the peculiar codes."""
+    return df[sales(df, codes)].groupby('InvoiceNo', as_index=False, observed=True).agg(
+        {'Quantity': 'sum', 'Amount': 'sum'})
+
+
+def country_amounts(df, codes=CODES):
+    """Quantity and Amount per Country, excluding the peculiar codes."""
+    return df[sales(df, codes)].groupby('Country', as_index=False, observed=True).agg(
+        {'Quantity': 'sum', 'Amount': 'sum'})
+
+
+def _counts(values):
+    """Value counts, without the unused categories of a categorical column."""
+    counts = values.value_counts()
+    return counts[counts > 0]
+
+
+def histogram(values, bins='auto', max_bins=MAX_BINS):
+    """Counts and edges of the finite ``values`` (at most ``max_bins`` bins), and their std for the KDE."""
+    values = np.asarray(values, dtype='float64')
+    values = values[np.isfinite(values)]
+    edges = np.histogram_bin_edges(values, bins)
+    if len(edges) > max_bins + 1:
+        edges = np.linspace(edges[0], edges[-1], max_bins + 1)
+    counts, edges = np.histogram(values, edges)
+    return {'counts': counts, 'edges': edges, 'std': float(values.std()) if len(values) else 0.0}
+
+
+def cluster_means(data_norm, labels):
+    """Mean and standard error of every normalized RFM variable per cluster."""
+    grouped = data_norm[RFM_COLUMNS].groupby(np.asarray(labels))
+    return {'mean': grouped.mean(), 'sem': grouped.sem().fillna(0)}
+
+
+def relative_importance(data, k):
+    """Cluster means of each RFM variable relative to the population mean."""
+    cluster_avg = data.groupby('Cluster_k{}'.format(k))[RFM_COLUMNS].mean()
+    population_avg = data[RFM_COLUMNS].mean()
+    return cluster_avg.divide(population_avg, axis=1)
+
+
+def aggregate(result, k=4, codes=CODES):
+    """The small tables every figure of a :func:`~retail_segmentation.pipeline.run` result is drawn from.
+
+    This is the only pass over the transactions and customers; the result is
+    keyed by figure name.
+    """
+    df, data = result['transactions'], result['rfm']
+    sizes = invoice_sizes(df)
+    amounts = invoice_amounts(df, codes).Amount
+    country = country_amounts(df, codes).set_index('Country').Amount
+    aggregates = {
+        'countries': _counts(df.Country).head(10),
+        'invoice_sizes': {'orders': histogram(sizes.Total_Orders, 40), 'check': _counts(sizes.check)},
+        'stock_codes': _counts(df.StockCode[df.StockCode.isin(codes)]),
+        'amounts': {'histogram': histogram(amounts[amounts != 0]),
+                    'categories': pd.cut(amounts[amounts > 0], AMOUNT_BINS, labels=AMOUNT_NAMES)
+                    .value_counts().reindex(AMOUNT_NAMES)},
+        'country_sales': country[country.index != 'United Kingdom'],
+        'retention': result['retention'],
+        'rfm_distributions': {col: histogram(data[col]) for col in RFM_COLUMNS},
+        'rfm_normalized': {col: histogram(result['data_norm'][col]) for col in RFM_COLUMNS},
+        'snake': {k: cluster_means(result['data_norm'], model.labels_) for k, model in sorted(result['models'].items())},
+    }
+    if 'sse' in result:
+        aggregates['elbow'] = list(result['sse'])
+    if k in result['models']:
+        aggregates['relative_importance'] = relative_importance(data, k)
+    return aggregates
+
+
+def save_aggregates(aggregates, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(aggregates, f)
+    os.replace(tmp, path)
+
+
+def load_aggregates(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _bars(hist):
+    plt, _ = _pyplot()
+    edges = hist['edges']
+    plt.hist(edges[:-1], edges, weights=hist['counts'])
+
+
+def _kde(hist, points=200):
+    """Gaussian KDE of the binned values with Scott's bandwidth, in counts per bin as seaborn draws it."""
+    counts, edges = hist['counts'], hist['edges']
+    n = counts.sum()
+    bandwidth = hist['std'] * n ** -0.2 if n else 0.0
+    if not bandwidth:
+        return None
+    centers = (edges[:-1] + edges[1:]) / 2
+    x = np.linspace(edges[0], edges[-1], points)
+    density = (counts * np.exp(-0.5 * ((x[:, None] - centers) / bandwidth) ** 2)).sum(axis=1)
+    return x, density / (bandwidth * np.sqrt(2 * np.pi)) * np.diff(edges).mean()
+
+
+def plot_countries(counts):
+    plt, sns = _pyplot()
+    fig = plt.figure(figsize=(18, 8))
+    plt.bar(counts.index.astype(str), counts.values, color=sns.color_palette('Accent', len(counts)))
+    plt.xlabel('Country')
+    plt.ylabel('count')
+    plt.xticks(rotation=45)
+    plt.title('Top 10 Countries in terms of no of orders')
+    return fig
+
+
+def plot_invoice_sizes(sizes):
+    plt, _ = _pyplot()
+    fig = plt.figure(figsize=(10, 5))
+    plt.subplot(1, 2, 1)
+    _bars(sizes['orders'])
+    plt.xlabel('Invoice')
+    plt.ylabel('Total Orders')
+    plt.subplot(1, 2, 2)
+    plt.bar(sizes['check'].index.astype(str), sizes['check'].values)
+    plt.xlabel('check')
+    plt.ylabel('count')
+    plt.grid()
+    return fig
+
+
+def plot_stock_codes(counts):
+    plt, _ = _pyplot()
+    fig = plt.figure(figsize=(10, 5))
+    plt.bar(counts.index.astype(str), counts.values)
+    plt.xlabel('StockCode')
+    plt.ylabel('count')
+    plt.xticks(rotation=60)
+    return fig
+
+
+def plot_amounts(amounts):
+    plt, _ = _pyplot()
+    fig = plt.figure(figsize=(18, 7))
+    plt.subplot(1, 2, 1)
+    _bars(amounts['histogram'])
+    plt.xlabel('Amount')
+    plt.ylabel('Count')
+    plt.subplot(1, 2, 2)
+    counts = amounts['categories']
+    plt.pie(counts.values, labels=counts.index, autopct=lambda x: '{:1.0f}%'.format(x) if x > 1 else '',
+            shadow=True, startangle=0)
+    return fig
+
+
+def plot_country_sales(amounts):
+    plt, _ = _pyplot()
+    fig = plt.figure(figsize=(18, 5))
+    plt.bar(amounts.index.astype(str), amounts.values)
+    plt.xlabel('Country')
+    plt.ylabel('Amount')
+    plt.xticks(rotation=45)
+    plt.title('Country-wise Sales(UK not included)', size=15)
+    return fig
+
+
+def plot_retention(retention):
+    plt, sns = _pyplot()
+    fig = plt.figure(figsize=(10, 8))
+    sns.heatmap(retention, annot=True, fmt='0.1f', cmap='BuGn')
+    plt.title('Retention rates')
+    return fig
+
+
+def plot_distributions(histograms, title=None):
+    """Histogram and KDE of each RFM variable, raw or normalized."""
+    plt, _ = _pyplot()
+    fig = plt.figure(figsize=(18, 10))
+    for i, col in enumerate(RFM_COLUMNS, 1):
+        plt.subplot(3, 1, i)
+        _bars(histograms[col])
+        kde = _kde(histograms[col])
+        if kde is not None:
+            plt.plot(*kde)
+        plt.xlabel(col)
+        plt.ylabel('Count')
+    if title:
+        fig.suptitle(title)
+    return fig
+
+
+def plot_snake(snake):
+    """Per-cluster mean of the normalized variables for every k, with 95% normal confidence bands."""
+    plt, _ = _pyplot()
+    fig = plt.figure(figsize=[18, 4])
+    fig.suptitle('Snake plot of standardized variables')
+    x = np.arange(len(RFM_COLUMNS))
+    for i, (k, means) in enumerate(snake.items(), 1):
+        plt.subplot(1, len(snake), i)
+        for cluster, mean in means['mean'].iterrows():
+            sem = means['sem'].loc[cluster].to_numpy()
+            line, = plt.plot(x, mean.to_numpy(), label=str(cluster))
+            plt.fill_between(x, mean - 1.96 * sem, mean + 1.96 * sem, color=line.get_color(), alpha=0.2)
+        plt.xticks(x, RFM_COLUMNS)
+        plt.xlabel('Features')
+        plt.ylabel('Value')
+        plt.legend(title='Cluster')
+        plt.title('K={}'.format(k))
+    return fig
+
+
+def plot_relative_importance(importance):
+    plt, sns = _pyplot()
+    fig = plt.figure(figsize=(8, 4))
+    plt.title('Relative importance of Attributes')
+    sns.heatmap(data=importance, annot=True, fmt='.2f', cmap='RdYlGn')
+    return fig
+
+
+def plot_elbow(sse):
+    plt, _ = _pyplot()
+    fig = plt.figure(figsize=(10, 4))
+    plt.title('The Elbow Method')
+    plt.xlabel('n_clusters')
+    plt.ylabel('Sum of squared errors')
+    plt.plot(range(1, len(sse) + 1), sse, marker='o', markerfacecolor='r')
+    plt.xticks(ticks=range(0, len(sse) + 1))
+    plt.grid()
+    return fig
+
+
+FIGURES = {
+    'countries': plot_countries,
+    'invoice_sizes': plot_invoice_sizes,
+    'stock_codes': plot_stock_codes,
+    'amounts': plot_amounts,
+    'country_sales': plot_country_sales,
+    'retention': plot_retention,
+    'rfm_distributions': plot_distributions,
+    'rfm_normalized': functools.partial(plot_distributions, title='Normalized'),
+    'snake': plot_snake,
+    'elbow': plot_elbow,
+    'relative_importance': plot_relative_importance,
+}
+
+
+def _draw(name, aggregate, out_dir, formats):
+    """Draw one figure and save it in every image format; returns ``(paths, svg)`` (svg for the HTML page)."""
+    plt, _ = _pyplot()
+    fig = FIGURES[name](aggregate)
+    paths, svg = [], None
+    for fmt in formats:
+        if fmt == 'html':
+            buffer = io.StringIO()
+            fig.savefig(buffer, format='svg', bbox_inches='tight')
+            svg = buffer.getvalue()
+        else:
+            path = os.path.join(out_dir, '{}.{}'.format(name, fmt))
+            fig.savefig(path, bbox_inches='tight')
+            paths.append(path)
+    plt.close(fig)
+    return paths, svg
+
+
+def render_aggregates(aggregates, out_dir, formats=('png',), n_jobs=None):
+    """Draw every figure of :func:`aggregate` into ``out_dir`` on a pool of ``n_jobs`` processes.
+
+    ``formats`` are matplotlib image formats, plus ``'html'`` for one
+    self-contained ``report.html`` with every figure inline as SVG. Returns
+    the written paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    names = [name for name in FIGURES if name in aggregates]
+    args = [(name, aggregates[name], out_dir, formats) for name in names]
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(names) or 1)
+    if n_jobs == 1:
+        drawn = [_draw(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(n_jobs) as pool:
+            drawn = list(pool.map(_draw, *zip(*args)))
+
+    paths = [path for figure_paths, _ in drawn for path in figure_paths]
+    if 'html' in formats:
+        path = os.path.join(out_dir, 'report.html')
+        with open(path, 'w') as f:
+            f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Customer segmentation</title></head><body>\n')
+            for name, (_, svg) in zip(names, drawn):
+                f.write('<h2>{}</h2>\n{}\n'.format(html.escape(name.replace('_', ' ')), svg[svg.index('<svg'):]))
+            f.write('</body></html>\n')
+        paths.append(path)
+    return paths
+
+
+def render(result, out_dir, k=4, formats=('png',), n_jobs=None):
+    """Write every figure for a :func:`~retail_segmentation.pipeline.run` result.
+
+    The aggregates are computed once and saved as ``aggregates.pkl`` in
+    ``out_dir``; see :func:`render_aggregates` for the formats. Returns the
+    list of written figure paths.
+    """
+    aggregates = aggregate(result, k)
+    os.makedirs(out_dir, exist_ok=True)
+    save_aggregates(aggregates, os.path.join(out_dir, AGGREGATES))
+    return render_aggregates(aggregates, out_dir, formats, n_jobs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='retail_segmentation.report',
+                                     description='Redraw the figures from the aggregates saved by --report.')
+    parser.add_argument('aggregates', help='aggregates.pkl written next to the figures')
+    parser.add_argument('-o', '--output', help='figure directory (default: that of the aggregates)')
+    parser.add_argument('--format', nargs='+', default=['png'], help='png, svg, pdf, ... or html (default: png)')
+    parser.add_argument('--jobs', type=int, default=None, help='rendering processes (default: all cores)')
+    args = parser.parse_args(argv)
+
+    out_dir = args.output or os.path.dirname(os.path.abspath(args.aggregates))
+    for path in render_aggregates(load_aggregates(args.aggregates), out_dir, args.format, args.jobs):
+        print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
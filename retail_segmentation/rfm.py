@@ -0,0 +1,356 @@
+"""Vectorized RFM engine.
+
+Recency, Frequency and MonetaryValue come from one grouped aggregation with
+cythonized reductions, and the quartile codes, RFM_Segment and RFM_Score are
+integer arithmetic on whole columns; no per-customer Python call is made.
+"""
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from .ingest import date_column
+
+RFM_COLUMNS = ['Recency', 'Frequency', 'MonetaryValue']
+
+# The definition of recency takes into consideration one complete year of data.
+WINDOW_DAYS = 364
+
+SEGMENT_BINS = [0, 5, 9, np.inf]
+SEGMENT_LABELS = ['Low', 'Middle', 'Top']
+
+
+def window(cohort_data, window_days=WINDOW_DAYS, kinds=None, amount='Amount', end=None):
+    """Purchases (Amount > 0) of the last ``window_days`` days and the snapshot date.
+
+    The snapshot date is the day after the last purchase in the window. Only
+    the columns the aggregation needs are taken, so the window is not a copy of
+    the whole transaction table. With an ``InvoiceDay`` column the dates are
+    day numbers and so is the snapshot. With ``kinds`` (e.g. ``['sale']``) the
+    lines of those :mod:`~retail_segmentation.classify` kinds count as
+    purchases instead. ``amount`` names the column used as the line Amount,
+    e.g. 'NetAmount' after :mod:`~retail_segmentation.netting`. ``end`` fixes
+    the last day of the window, and the snapshot is the day after it; a
+    partition of the data is then measured against the same snapshot as the
+    whole.
+    """
+    col = date_column(cohort_data)
+    one_day = 1 if col == 'InvoiceDay' else dt.timedelta(days=1)
+    dates = cohort_data[col]
+    start_date = (dates.max() if end is None else end) - window_days * one_day
+    purchases = cohort_data[amount] > 0
+    if kinds is not None:
+        purchases &= cohort_data.Kind.isin(kinds)
+    mask = ((dates >= start_date) & purchases).to_numpy()
+    data_rfm = cohort_data.loc[mask, ['CustomerID', col, 'InvoiceNo', amount]]
+    if amount != 'Amount':
+        data_rfm = data_rfm.rename(columns={amount: 'Amount'})
+    snapshot_date = (data_rfm[col].max() if end is None else end) + one_day
+    return data_rfm, snapshot_date
+
+
+def aggregate(data_rfm, snapshot_date):
+    """Per-customer Recency (days), Frequency (lines) and MonetaryValue."""
+    col = date_column(data_rfm)
+    g = data_rfm.groupby('CustomerID', sort=True)
+    recency = snapshot_date - g[col].max()
+    data = pd.DataFrame({'Recency': recency.astype('int64') if col == 'InvoiceDay' else recency.dt.days,
+                         'Frequency': g['InvoiceNo'].count(),
+                         'MonetaryValue': g['Amount'].sum()})
+    return data.reset_index()
+
+
+def quartile_codes(values, ascending=True):
+    """Quartile of every value as 1..4, with 4 for the top quartile.
+
+    With ``ascending=False`` the lowest quartile scores 4, as Recency does.
+    """
+    codes = pd.qcut(values, 4, labels=False)
+    return (codes + 1 if ascending else 4 - codes).astype('int8')
+
+
+def cut_codes(values, edges, ascending=True):
+    """:func:`quartile_codes` against given inner cut points instead of the exact quartiles.
+
+    A value falls in the first bin whose upper edge it does not exceed, as in
+    ``pd.qcut``.
+    """
+    codes = np.searchsorted(np.asarray(edges), np.asarray(values), side='left')
+    return (codes + 1 if ascending else len(edges) - codes + 1).astype('int8')
+
+
+def cut_points(data, quantiles=(0.25, 0.5, 0.75)):
+    """Inner quartile cut points of the RFM columns of ``data``, the edges ``pd.qcut`` cuts them at."""
+    return {col: data[col].quantile(list(quantiles)).to_numpy() for col in RFM_COLUMNS}
+
+
+def score(data, bins=SEGMENT_BINS, labels=SEGMENT_LABELS, cut_points=None):
+    """Add R, F, M, RFM_Segment, RFM_Score and General_Segment to ``data`` in place.
+
+    The quartiles are exact (``pd.qcut``) unless ``cut_points`` maps each RFM
+    column to its three inner cut points, e.g. from the mergeable sketches of
+    :mod:`retail_segmentation.sketch`; then partitions of the customers can be
+    scored separately and consistently.
+    """
+    if cut_points is None:
+        data['R'] = quartile_codes(data.Recency, ascending=False)
+        data['F'] = quartile_codes(data.Frequency)
+        data['M'] = quartile_codes(data.MonetaryValue)
+    else:
+        data['R'] = cut_codes(data.Recency, cut_points['Recency'], ascending=False)
+        data['F'] = cut_codes(data.Frequency, cut_points['Frequency'])
+        data['M'] = cut_codes(data.MonetaryValue, cut_points['MonetaryValue'])
+
+    digits = data.R.astype('int16') * 100 + data.F * 10 + data.M
+    data['RFM_Segment'] = digits.astype(str)
+    data['RFM_Score'] = data.R.astype('int64') + data.F + data.M
+    data['General_Segment'] = pd.cut(data.RFM_Score, bins=bins, labels=labels)
+    return data
+
+
+def compute(cohort_data, window_days=WINDOW_DAYS, bins=SEGMENT_BINS, labels=SEGMENT_LABELS, kinds=None,
+            amount='Amount', cut_points=None, end=None):
+    """RFM frame of every customer with a purchase in the window."""
+    data_rfm, snapshot_date = window(cohort_data, window_days, kinds, amount, end)
+    return score(aggregate(data_rfm, snapshot_date), bins=bins, labels=labels, cut_points=cut_points)
+
+
+def month_snapshots(dates, months=24):
+    """Snapshot dates of the last ``months`` month-ends covered by ``dates``.
+
+    A snapshot is the day after the month-end, the first of the next month, as
+    the notebook's snapshot date is the day after the last purchase. Only
+    snapshots after the first date are returned.
+    """
+    days = day_number(dates)
+    first, last = np.datetime64(int(days.min()), 'D'), np.datetime64(int(days.max()) + 1, 'D')
+    snapshots = pd.date_range(end=last.astype('datetime64[M]').astype('datetime64[ns]'), periods=months, freq='MS')
+    return snapshots[snapshots > first.astype('datetime64[ns]')]
+
+
+def rolling(cohort_data, snapshots, window_days=WINDOW_DAYS, kinds=None, amount='Amount', scored=True,
+            bins=SEGMENT_BINS, labels=SEGMENT_LABELS, cut_points=None):
+    """Long table of the RFM values (and scores) of every customer as of each snapshot date.
+
+    For a snapshot ``s`` the window holds the purchases dated before ``s``
+    and at most ``window_days`` days before the day preceding it, so it
+    equals :func:`compute` with ``end`` the day before ``s`` on the purchases
+    dated before ``s`` (``end`` only moves the window start and the snapshot;
+    it does not drop later dates). Customers without a purchase in the
+    window are left out. The purchases are sorted by (CustomerID,
+    day) once, with per-customer cumulative amounts; every snapshot is then
+    two binary searches per customer, so the transactions are not scanned
+    again per snapshot. With ``scored`` every snapshot is scored on its own
+    quartiles, as :func:`score` does (so it raises on too many ties), or on
+    fixed ``cut_points``. Snapshots are dates, or day numbers for compact
+    frames, and come back the same way in the ``snapshot`` column.
+    """
+    col = date_column(cohort_data)
+    purchases = (cohort_data[amount] > 0).to_numpy()
+    if kinds is not None:
+        purchases &= cohort_data.Kind.isin(kinds).to_numpy()
+    customers, customer = np.unique(cohort_data.CustomerID.to_numpy()[purchases], return_inverse=True)
+    day = day_number(cohort_data[col].to_numpy()[purchases]).astype('int64')
+    amounts = cohort_data[amount].to_numpy()[purchases].astype('float64')
+    snapshot_days = day_number(snapshots).astype('int64')
+    columns = ['CustomerID', 'snapshot'] + RFM_COLUMNS
+    if not len(day):
+        return pd.DataFrame(columns=columns)
+
+    # One sortable int per (customer, day), with room for the day after the last one.
+    first_day = day.min()
+    span = int(day.max() - first_day) + 2
+    key = customer.astype('int64') * span + (day - first_day)
+    order = np.argsort(key, kind='stable')
+    key, day, customer = key[order], day[order], customer[order]
+    spent = pd.Series(amounts[order]).groupby(customer, sort=False).cumsum().to_numpy()
+    base = np.arange(len(customers), dtype='int64') * span
+    starts = np.searchsorted(key, base, side='left')
+
+    frames = []
+    for snapshot, s in zip(snapshots, snapshot_days):
+        lo = np.searchsorted(key, base + np.clip(s - 1 - window_days - first_day, 0, span - 1), side='left')
+        hi = np.searchsorted(key, base + np.clip(s - first_day, 0, span - 1), side='left')
+        active = np.flatnonzero(hi > lo)
+        if not len(active):
+            continue
+        lo, hi = lo[active], hi[active]
+        before = np.where(lo > starts[active], spent[lo - 1], 0.0)
+        data = pd.DataFrame({'CustomerID': customers[active],
+                             'snapshot': s if col == 'InvoiceDay' else np.datetime64(int(s), 'D').astype('datetime64[ns]'),
+                             'Recency': s - day[hi - 1],
+                             'Frequency': hi - lo,
+                             'MonetaryValue': spent[hi - 1] - before})
+        frames.append(score(data, bins=bins, labels=labels, cut_points=cut_points) if scored else data)
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def day_number(dates):
+    """Days since 1970-01-01 of each date, as int32; integers are taken as day numbers already."""
+    dates = np.asarray(dates)
+    if dates.dtype.kind in 'iu':
+        return dates.astype('int32')
+    return dates.astype('datetime64[ns]').astype('datetime64[D]').astype('int32')
+
+
+class RFMState:
+    """Per-customer RFM aggregates over a trailing window, updatable day by day.
+
+    Arrays are addressed directly by the integer CustomerID: ``last_day`` is the
+    day number of the last purchase (-1 if none), ``frequency`` and ``monetary``
+    the purchase lines and amount inside the window. The per-day contributions
+    are kept so that days leaving the window can be subtracted again; an update
+    or an expiry costs time proportional to the days it touches, and
+    :meth:`frame` is a read of the arrays instead of a groupby over the history.
+    MonetaryValue is maintained by additions and subtractions, so it can differ
+    from a fresh sum in the last floating point digits.
+    """
+
+    def __init__(self, window_days=WINDOW_DAYS):
+        self.window_days = window_days
+        self.day = None
+        self.last_day = np.full(0, -1, dtype='int32')
+        self.frequency = np.zeros(0, dtype='int64')
+        self.monetary = np.zeros(0, dtype='float64')
+        self._days = {}
+
+    @classmethod
+    def from_transactions(cls, df, window_days=WINDOW_DAYS):
+        return cls(window_days).update(df)
+
+    def _reserve(self, max_customer):
+        if max_customer < len(self.last_day):
+            return
+        size = max(max_customer + 1, 2 * len(self.last_day))
+        n = len(self.last_day)
+        self.last_day = np.concatenate([self.last_day, np.full(size - n, -1, dtype='int32')])
+        self.frequency = np.concatenate([self.frequency, np.zeros(size - n, dtype='int64')])
+        self.monetary = np.concatenate([self.monetary, np.zeros(size - n, dtype='float64')])
+
+    def _add(self, day, customers, counts, amounts):
+        self._days[day] = (customers, counts, amounts)
+        np.add.at(self.frequency, customers, counts)
+        np.add.at(self.monetary, customers, amounts)
+
+    def update(self, df):
+        """Fold transactions (CustomerID, InvoiceDate or InvoiceDay, Amount) into the state.
+
+        Only purchases (Amount > 0) count. Days already behind the window are
+        ignored; a day already present is merged with the new lines.
+        """
+        df = df[df.Amount > 0]
+        if df.empty:
+            return self
+        day = day_number(df[date_column(df)])
+        customer = np.asarray(df.CustomerID, dtype='int64')
+        self._reserve(int(customer.max()))
+
+        latest = int(day.max()) if self.day is None else max(self.day, int(day.max()))
+        keep = day >= latest - self.window_days
+        daily = pd.DataFrame({'day': day[keep], 'customer': customer[keep],
+                              'amount': np.asarray(df.Amount, dtype='float64')[keep]})
+        daily = daily.groupby(['day', 'customer']).agg(count=('amount', 'size'), amount=('amount', 'sum')).reset_index()
+        np.maximum.at(self.last_day, daily.customer.to_numpy(), daily.day.to_numpy().astype('int32'))
+
+        for d, rows in daily.groupby('day'):
+            d = int(d)
+            customers, counts, amounts = (rows.customer.to_numpy(), rows['count'].to_numpy(), rows.amount.to_numpy())
+            if d in self._days:
+                old = self._days.pop(d)
+                np.subtract.at(self.frequency, old[0], old[1])
+                np.subtract.at(self.monetary, old[0], old[2])
+                merged = pd.DataFrame({'customer': np.concatenate([old[0], customers]),
+                                       'count': np.concatenate([old[1], counts]),
+                                       'amount': np.concatenate([old[2], amounts])}).groupby('customer').sum()
+                customers, counts, amounts = (merged.index.to_numpy(), merged['count'].to_numpy(),
+                                              merged.amount.to_numpy())
+            self._add(d, customers, counts, amounts)
+        return self.advance(latest)
+
+    def advance(self, day):
+        """Move the clock to ``day`` (a day number or a date) and expire old days."""
+        if not isinstance(day, (int, np.integer)):
+            day = int(day_number([day])[0])
+        if self.day is not None and day < self.day:
+            raise ValueError('the state cannot move back in time')
+        self.day = day
+        expired = self._expired(day)
+        self._subtract(self.frequency, self.monetary, expired)
+        for d in expired:
+            del self._days[d]
+        return self
+
+    def _expired(self, day):
+        """Logged days that are out of the window ending on ``day``."""
+        return [d for d in sorted(self._days) if d < day - self.window_days]
+
+    def _subtract(self, frequency, monetary, days):
+        for d in days:
+            customers, counts, amounts = self._days[d]
+            np.subtract.at(frequency, customers, counts)
+            np.subtract.at(monetary, customers, amounts)
+            # Drop the rounding residue of customers who left the window.
+            monetary[customers[frequency[customers] == 0]] = 0.0
+
+    @property
+    def snapshot_date(self):
+        """The day after the clock, as in the notebook."""
+        return pd.Timestamp(np.datetime64(self.day + 1, 'D'))
+
+    def frame(self, scored=True, cut_points=None, snapshot_date=None, bins=SEGMENT_BINS, labels=SEGMENT_LABELS):
+        """RFM frame of every customer with a purchase in the window.
+
+        Same columns as :func:`compute`; with ``scored=False`` only CustomerID,
+        Recency, Frequency and MonetaryValue. ``cut_points``, ``bins`` and
+        ``labels`` are passed on to :func:`score`. ``snapshot_date`` (a date
+        or day number) defaults to :attr:`snapshot_date`. A later one
+        counts the purchases held so far against a window ending the day
+        before it, without moving the clock; the days leaving that window
+        are subtracted from copies of the arrays. An earlier one raises
+        ValueError: the days before the window have been dropped, and later
+        purchases already counted.
+        """
+        day, frequency, monetary = self.day, self.frequency, self.monetary
+        if snapshot_date is not None:
+            if not isinstance(snapshot_date, (int, np.integer)):
+                snapshot_date = int(day_number([snapshot_date])[0])
+            if self.day is not None and snapshot_date <= self.day:
+                raise ValueError('the state is at {}; it has no frame as of an earlier snapshot date'.format(
+                    self.snapshot_date.date()))
+            day = snapshot_date - 1
+            expired = self._expired(day)
+            if expired:
+                frequency, monetary = frequency.copy(), monetary.copy()
+                self._subtract(frequency, monetary, expired)
+        customers = np.flatnonzero(frequency > 0)
+        data = pd.DataFrame({'CustomerID': customers.astype('float64'),
+                             'Recency': (day + 1 - self.last_day[customers]).astype('int64'),
+                             'Frequency': frequency[customers],
+                             'MonetaryValue': monetary[customers]})
+        return score(data, bins=bins, labels=labels, cut_points=cut_points) if scored else data
+
+    def save(self, path):
+        days = sorted(self._days)
+        chunks = [self._days[d] for d in days]
+        np.savez(path, window_days=self.window_days, clock=-1 if self.day is None else self.day,
+                 last_day=self.last_day, frequency=self.frequency, monetary=self.monetary,
+                 log_day=np.repeat(np.array(days, dtype='int32'), [len(c[0]) for c in chunks]),
+                 log_customer=np.concatenate([c[0] for c in chunks] or [np.zeros(0, 'int64')]),
+                 log_count=np.concatenate([c[1] for c in chunks] or [np.zeros(0, 'int64')]),
+                 log_amount=np.concatenate([c[2] for c in chunks] or [np.zeros(0, 'float64')]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            state = cls(int(f['window_days']))
+            state.day = int(f['clock']) if f['clock'] >= 0 else None
+            state.last_day, state.frequency, state.monetary = f['last_day'], f['frequency'], f['monetary']
+            log_day, customers, counts, amounts = f['log_day'], f['log_customer'], f['log_count'], f['log_amount']
+        if len(log_day):
+            bounds = np.flatnonzero(np.diff(log_day)) + 1
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(log_day)]):
+                state._days[int(log_day[start])] = (customers[start:end], counts[start:end], amounts[start:end])
+        return state
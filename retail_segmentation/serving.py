@@ -0,0 +1,147 @@
+"""Low-latency segment scoring from the fitted scaler and KMeans centroids.
+
+The log transform, the StandardScaler statistics and the centroids are saved
+as one small ``.npz`` artifact. :class:`SegmentModel` assigns clusters to raw
+Recency/Frequency/MonetaryValue rows with a vectorized nearest-centroid search,
+without scikit-learn, and :func:`serve` exposes it over HTTP:
+
+    python -m retail_segmentation.serving segments.npz --port 8000
+    curl -d '{"rows": [[12, 5, 830.5]]}' localhost:8000/predict
+"""
+
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from .rfm import RFM_COLUMNS
+
+
+class SegmentModel:
+    """log -> standardize -> nearest centroid, as fitted by the pipeline."""
+
+    def __init__(self, mean, scale, centroids, columns=RFM_COLUMNS):
+        self.mean = np.asarray(mean, dtype='float64')
+        self.scale = np.asarray(scale, dtype='float64')
+        self.centroids = np.asarray(centroids, dtype='float64')
+        self.columns = list(columns)
+        # Precomputed for the ||x||^2 - 2 x.c + ||c||^2 expansion; ||x||^2 is
+        # the same for every centroid and can be left out of the argmin.
+        self._centroid_sq = (self.centroids ** 2).sum(axis=1)
+
+    @classmethod
+    def from_fitted(cls, scaler, kmeans):
+        return cls(scaler.mean_, scaler.scale_, kmeans.cluster_centers_,
+                   getattr(scaler, 'feature_names_in_', RFM_COLUMNS))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['mean'], f['scale'], f['centroids'], [str(c) for c in f['columns']])
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, scale=self.scale, centroids=self.centroids,
+                 columns=np.array(self.columns))
+
+    @property
+    def k(self):
+        return len(self.centroids)
+
+    def transform(self, X):
+        """Normalized RFM values of raw rows; ValueError unless every value is finite and positive."""
+        X = np.asarray(X, dtype='float64')
+        invalid = ~(np.isfinite(X) & (X > 0))
+        if invalid.any():
+            row = int(np.flatnonzero(invalid.any(axis=-1))[0]) if X.ndim > 1 else 0
+            raise ValueError('RFM values must be finite and positive, row {} is {}'.format(
+                row, X[row].tolist() if X.ndim > 1 else X.tolist()))
+        return (np.log(X) - self.mean) / self.scale
+
+    def predict(self, X):
+        """Cluster id of every raw (Recency, Frequency, MonetaryValue) row.
+
+        ``X`` may be an array of shape (n, 3) or a DataFrame holding the RFM
+        columns. Raises ValueError on a zero, negative or missing value, which
+        has no segment; the HTTP service answers 400.
+        """
+        if hasattr(X, 'columns'):
+            X = X[self.columns].to_numpy()
+        Z = self.transform(np.atleast_2d(X))
+        return np.argmin(self._centroid_sq - 2.0 * Z @ self.centroids.T, axis=1)
+
+
+def export(scaler, kmeans, path):
+    """Save a fitted scaler and KMeans as a scoring artifact."""
+    model = SegmentModel.from_fitted(scaler, kmeans)
+    model.save(path)
+    return model
+
+
+def _rows(payload, columns):
+    """Raw rows from ``{"rows": [[R, F, M], ...]}`` or ``{"Recency": [...], ...}``."""
+    if 'rows' in payload:
+        return np.asarray(payload['rows'], dtype='float64')
+    return np.column_stack([np.asarray(payload[c], dtype='float64') for c in columns])
+
+
+def make_handler(model):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._reply(200, {'k': model.k, 'columns': model.columns})
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._reply(404, {'error': 'not found'})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                clusters = model.predict(_rows(payload, model.columns))
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(400, {'error': str(e)})
+                return
+            self._reply(200, {'clusters': clusters.tolist()})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(model, host='127.0.0.1', port=8000):
+    """HTTP server answering ``POST /predict`` and ``GET /health``; call ``serve_forever()`` on it."""
+    return ThreadingHTTPServer((host, port), make_handler(model))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='retail_segmentation.serving', description='Serve a segment scoring artifact.')
+    parser.add_argument('model', help='artifact written by --export')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    server = serve(SegmentModel.load(args.model), args.host, args.port)
+    print('Serving on http://{}:{}'.format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Mergeable quantile sketch for the R/F/M quartile cut points.
+
+``pd.qcut`` needs every customer in one process. :class:`QuantileSketch` is a
+KLL sketch: a stack of compactors where an item at level ``h`` stands for
+``2**h`` values, and a full level is sorted and every other item promoted to
+the next. It keeps O(k) items, its rank error stays within about 2 / k
+(0.2% at the default k = 1000), and two sketches merge into one with the
+same guarantee. So shards or streamed batches of customers can each be sketched,
+merged, and scored against the same cut points:
+
+    sketches = merge([rfm_sketches(shard) for shard in shards])
+    data = rfm.score(shard, cut_points=cut_points(sketches))
+"""
+
+import numpy as np
+
+from .rfm import RFM_COLUMNS
+
+QUARTILES = (0.25, 0.5, 0.75)
+
+# Capacity of a level relative to the one above it, and the smallest capacity.
+SHRINK = 2.0 / 3.0
+MIN_CAPACITY = 8
+
+
+class QuantileSketch:
+    """KLL quantile sketch of a stream of numbers; ``k`` trades size for accuracy."""
+
+    def __init__(self, k=1000, seed=0):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.zeros(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_values(cls, values, k=1000, seed=0):
+        return cls(k, seed).update(values)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            sketch = cls(int(f['k']))
+            sketch.n, sketch.min, sketch.max = int(f['n']), float(f['min']), float(f['max'])
+            sketch.levels = np.split(f['items'], np.cumsum(f['sizes'])[:-1])
+        return sketch
+
+    def save(self, path):
+        np.savez(path, k=self.k, n=self.n, min=self.min, max=self.max,
+                 items=np.concatenate(self.levels), sizes=[len(level) for level in self.levels])
+
+    def __len__(self):
+        return self.n
+
+    def _capacity(self, h):
+        return max(MIN_CAPACITY, int(np.ceil(self.k * SHRINK ** (len(self.levels) - h - 1))))
+
+    def _compress(self):
+        """Compact the lowest full level until every level is within capacity."""
+        while True:
+            full = [h for h, level in enumerate(self.levels) if len(level) > self._capacity(h)]
+            if not full:
+                return
+            h = full[0]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.zeros(0))
+            items = np.sort(self.levels[h])
+            odd = len(items) % 2
+            # An odd item out stays; of the rest, a random half survives with double weight.
+            self.levels[h] = items[:odd]
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[odd + self._rng.integers(2)::2]])
+
+    def update(self, values):
+        """Add a batch of values (NaN is ignored)."""
+        values = np.asarray(values, dtype='float64').ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            # A batch larger than k is sorted once and compacted h times in one
+            # go: every 2**h-th item, from a random offset, stands for 2**h values.
+            h = max(0, int(np.ceil(np.log2(len(values) / self.k))))
+            if h:
+                values = np.sort(values)[self._rng.integers(2 ** h)::2 ** h]
+            while len(self.levels) <= h:
+                self.levels.append(np.zeros(0))
+            self.levels[h] = np.concatenate([self.levels[h], values])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold ``other`` into this sketch."""
+        self.k = max(self.k, other.k)
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _check_not_empty(self):
+        if not self.n:
+            raise ValueError('the quantile sketch is empty: no values were added')
+
+    def quantile(self, q):
+        """Approximate ``q``-quantile(s); 0 and 1 give the exact min and max."""
+        self._check_not_empty()
+        q = np.asarray(q, dtype='float64')
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        pos = np.minimum(np.searchsorted(cumulative, q * cumulative[-1], side='left'), len(items) - 1)
+        result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, items[pos]))
+        return result if result.ndim else float(result)
+
+    def rank(self, x):
+        """Approximate fraction of the values <= ``x``."""
+        self._check_not_empty()
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        return weights[items <= x].sum() / weights.sum()
+
+
+def rfm_sketches(data, k=1000, columns=RFM_COLUMNS, seed=0):
+    """One :class:`QuantileSketch` per RFM column of a (partial) customer table."""
+    return {col: QuantileSketch.from_values(data[col].to_numpy(), k, seed) for col in columns}
+
+
+def merge(sketches):
+    """Merge a list of :func:`rfm_sketches` dicts column by column."""
+    sketches = list(sketches)
+    merged = {col: QuantileSketch(s.k) for col, s in sketches[0].items()}
+    for part in sketches:
+        for col, s in part.items():
+            merged[col].merge(s)
+    return merged
+
+
+def cut_points(sketches, quantiles=QUARTILES):
+    """Inner cut points of every column, for :func:`retail_segmentation.rfm.score`."""
+    return {col: s.quantile(quantiles) for col, s in sketches.items()}
@@ -0,0 +1,140 @@
+"""Content-addressed cache of pipeline stage results.
+
+Every stage result is stored under a key hashed from the key of the stage it
+reads from and its own parameters, so the key of the first stage (the digest
+of the source file) flows into all the others. Changing a parameter only
+changes the keys downstream of it; a run that only touches the K range or the
+segment bins finds the transactions, cohort table, RFM values and
+normalized matrix already there and skips those stages.
+
+An entry is a directory of files, one per result: DataFrames with string
+column names as Parquet, arrays as ``.npy``, and everything else (the scaler,
+fitted models, small tables) pickled. ``index.json`` records the size and the
+last use of every entry; the least recently used ones are evicted once the
+cache outgrows its size limit.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+# Part of every key: bump it when a stage's output changes, so stale entries stop matching.
+VERSION = 1
+
+MAX_MB = 4096
+
+_INDEX_FILE = 'index.json'
+
+
+def key(*parts):
+    """Hex key of ``parts``: the upstream key and the stage parameters, JSON-encoded."""
+    text = json.dumps([VERSION] + list(parts), sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:24]
+
+
+def _columnar(value):
+    return isinstance(value, pd.DataFrame) and all(isinstance(c, str) for c in value.columns)
+
+
+def _write(value, path):
+    """Write ``value`` to ``path`` + the extension of its format; returns the file name."""
+    if _columnar(value):
+        value.to_parquet(path + '.parquet')
+        return os.path.basename(path) + '.parquet'
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        np.save(path + '.npy', value)
+        return os.path.basename(path) + '.npy'
+    with open(path + '.pkl', 'wb') as f:
+        pickle.dump(value, f)
+    return os.path.basename(path) + '.pkl'
+
+
+def _read(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    if path.endswith('.npy'):
+        return np.load(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class StageCache:
+    """Stage results in ``directory``, at most ``max_mb`` of them (least recently used evicted first)."""
+
+    def __init__(self, directory, max_mb=MAX_MB):
+        self.directory = directory
+        self.max_bytes = max_mb * 2 ** 20
+        os.makedirs(directory, exist_ok=True)
+
+    def _index(self):
+        try:
+            with open(os.path.join(self.directory, _INDEX_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        tmp = os.path.join(self.directory, _INDEX_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(self.directory, _INDEX_FILE))
+
+    def _path(self, stage, key):
+        return os.path.join(self.directory, '{}-{}'.format(stage, key))
+
+    def __contains__(self, entry):
+        stage, key = entry
+        return '{}-{}'.format(stage, key) in self._index() and os.path.isdir(self._path(stage, key))
+
+    def get(self, stage, key, names=None):
+        """The results stored by :meth:`put` as a dict, only ``names`` if given; None on a miss."""
+        index = self._index()
+        entry = index.get('{}-{}'.format(stage, key))
+        path = self._path(stage, key)
+        if entry is None or not os.path.isdir(path):
+            return None
+        entry['used'] = time.time()
+        self._write_index(index)
+        return {name: _read(os.path.join(path, f)) for name, f in entry['files'].items()
+                if names is None or name in names}
+
+    def put(self, stage, key, results):
+        """Store the dict of ``results`` under ``(stage, key)`` and evict down to the size limit."""
+        path = self._path(stage, key)
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        files = {name: _write(value, os.path.join(tmp, name)) for name, value in results.items()}
+        size = sum(os.path.getsize(os.path.join(tmp, f)) for f in files.values())
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+        index = self._index()
+        index['{}-{}'.format(stage, key)] = {'files': files, 'bytes': size, 'used': time.time()}
+        self._evict(index, keep='{}-{}'.format(stage, key))
+        self._write_index(index)
+        return results
+
+    def _evict(self, index, keep=None):
+        total = sum(entry['bytes'] for entry in index.values())
+        for name in sorted(index, key=lambda name: index[name]['used']):
+            if total <= self.max_bytes:
+                break
+            if name != keep:
+                total -= index.pop(name)['bytes']
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def size(self):
+        """Bytes held by the cache."""
+        return sum(entry['bytes'] for entry in self._index().values())
+
+    def clear(self):
+        for name in self._index():
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        self._write_index({})
@@ -0,0 +1,188 @@
+"""Seeded generator of synthetic Online Retail transactions.
+
+The tables have the schema of ``Online_Retail.xlsx`` and mimic its skew: a
+UK-heavy Country mix, about 16% of invoices cancelled ('C' prefix, negative
+quantities), a handful of non-product StockCodes (POST, D, M, ...), long-tailed
+customer activity, ~25% anonymous lines and ~1% exact duplicate lines. Rows are
+produced in chronological chunks, so 100M-row files can be written without
+holding them in memory:
+
+    python -m retail_segmentation.synthetic 10000000 retail-10M.parquet
+"""
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .ingest import COLUMNS
+
+COUNTRIES = {
+    'United Kingdom': 0.889, 'Germany': 0.023, 'France': 0.021, 'EIRE': 0.019, 'Spain': 0.006,
+    'Netherlands': 0.006, 'Belgium': 0.005, 'Switzerland': 0.005, 'Portugal': 0.004, 'Australia': 0.003,
+    'Norway': 0.003, 'Italy': 0.002, 'Channel Islands': 0.002, 'Finland': 0.002, 'Cyprus': 0.002,
+    'Sweden': 0.001, 'Austria': 0.001, 'Denmark': 0.001, 'Japan': 0.001, 'Poland': 0.001,
+    'USA': 0.001, 'Israel': 0.001, 'Unspecified': 0.001,
+}
+
+# Non-product StockCodes with their share among such lines and a typical price.
+PECULIAR = {
+    'POST': (0.45, 'POSTAGE', 18.0),
+    'M': (0.20, 'Manual', 2.5),
+    'D': (0.12, 'Discount', 10.0),
+    'C2': (0.05, 'CARRIAGE', 50.0),
+    'DOT': (0.08, 'DOTCOM POSTAGE', 150.0),
+    'BANK CHARGES': (0.04, 'Bank Charges', 15.0),
+    'PADS': (0.02, 'PADS TO MATCH ALL CUSHIONS', 0.001),
+    'CRUK': (0.02, 'CRUK Commission', 30.0),
+    'AMAZONFEE': (0.02, 'AMAZON FEE', 1500.0),
+}
+
+_ADJECTIVES = ['WHITE', 'RED', 'PINK', 'BLUE', 'VINTAGE', 'RETROSPOT', 'REGENCY', 'HEART', 'GLASS',
+               'PAPER', 'JUMBO', 'SET OF 3', 'WOODEN', 'SPOTTY', 'CHRISTMAS', 'FELTCRAFT', 'PARTY']
+_NOUNS = ['T-LIGHT HOLDER', 'LANTERN', 'BAG', 'MUG', 'CAKE CASES', 'BUNTING', 'CUSHION COVER',
+          'ALARM CLOCK', 'LUNCH BOX', 'TEACUP AND SAUCER', 'NAPKINS', 'DOORMAT', 'CANDLE', 'SIGN']
+
+START = '2010-12-01'
+DAYS = 374
+ROWS_PER_CUSTOMER = 125
+MEAN_LINES = 22
+CANCELLED_SHARE = 0.16
+ANONYMOUS_SHARE = 0.25
+PECULIAR_SHARE = 0.005
+DUPLICATE_SHARE = 0.01
+
+
+def catalog(n_products=3958, seed=0):
+    """Product StockCodes, Descriptions and base prices, plus the peculiar codes."""
+    rng = np.random.default_rng(seed)
+    numbers = rng.choice(np.arange(10002, 90000), n_products, replace=False)
+    suffix = np.where(rng.random(n_products) < 0.1, rng.choice(list('ABCDEFGLNPS'), n_products), '')
+    codes = np.char.add(numbers.astype(str), suffix)
+    descriptions = np.char.add(np.char.add(rng.choice(_ADJECTIVES, n_products), ' '), rng.choice(_NOUNS, n_products))
+    prices = np.round(rng.lognormal(0.9, 0.8, n_products), 2)
+    products = pd.DataFrame({'StockCode': codes, 'Description': descriptions, 'UnitPrice': prices})
+    peculiar = pd.DataFrame([(code, desc, price) for code, (_, desc, price) in PECULIAR.items()],
+                            columns=['StockCode', 'Description', 'UnitPrice'])
+    return products, peculiar
+
+
+def customers(n, seed=0):
+    """CustomerIDs, their Country and their activity weights (Pareto tail)."""
+    rng = np.random.default_rng(seed + 1)
+    names = list(COUNTRIES)
+    p = np.array(list(COUNTRIES.values()))
+    return pd.DataFrame({'CustomerID': np.arange(12346, 12346 + n, dtype='float64'),
+                         'Country': np.array(names)[rng.choice(len(names), n, p=p / p.sum())],
+                         'weight': rng.pareto(1.2, n) + 0.05})
+
+
+def _weighted(rng, cumulative, n):
+    return np.searchsorted(cumulative, rng.random(n) * cumulative[-1])
+
+
+def generate(rows, seed=0, chunk_rows=1000000, n_customers=None, start=START, days=DAYS):
+    """Yield chronological chunks of a synthetic transaction table with ``rows`` rows in total."""
+    rng = np.random.default_rng(seed)
+    products, peculiar = catalog(seed=seed)
+    people = customers(n_customers or max(rows // ROWS_PER_CUSTOMER, 100), seed)
+    popularity = np.cumsum(1.0 / np.arange(1, len(products) + 1) ** 0.9)
+    peculiar_p = np.cumsum([share for share, _, _ in PECULIAR.values()])
+    activity = np.cumsum(people.weight.to_numpy())
+    countries = np.array(list(COUNTRIES))
+    country_p = np.cumsum(list(COUNTRIES.values()))
+
+    start = pd.Timestamp(start).value
+    span = days * 86400 * 10 ** 9
+    n_chunks = max(1, -(-rows // chunk_rows))
+    invoice_offset = 536365
+
+    for i in range(n_chunks):
+        n = min(chunk_rows, rows - i * chunk_rows)
+        n_unique = n - int(n * DUPLICATE_SHARE)
+
+        # Invoices: cancellations are short, purchases long-tailed. Draw a few
+        # more than needed on average, then keep only the invoices the lines
+        # fill (the last one cut short), so the dates below span the whole chunk.
+        mean_lines = MEAN_LINES * (1 - CANCELLED_SHARE) + 1.0 / 0.6 * CANCELLED_SHARE
+        cancelled, lines = np.zeros(0, dtype=bool), np.zeros(0, dtype='int64')
+        while lines.sum() < n_unique:
+            m = int((n_unique - lines.sum()) / mean_lines * 1.1) + 1
+            c = rng.random(m) < CANCELLED_SHARE
+            cancelled = np.concatenate([cancelled, c])
+            lines = np.concatenate([lines, np.where(c, rng.geometric(0.6, m), rng.geometric(1.0 / MEAN_LINES, m))])
+        n_inv = int(np.searchsorted(np.cumsum(lines), n_unique)) + 1
+        cancelled, lines = cancelled[:n_inv], lines[:n_inv]
+        lines[-1] -= lines.sum() - n_unique
+        invoice_no = np.arange(invoice_offset, invoice_offset + n_inv)
+        invoice_offset += n_inv
+
+        lo, hi = start + span * i // n_chunks, start + span * (i + 1) // n_chunks
+        dates = np.sort(rng.integers(lo, hi, n_inv)) // (60 * 10 ** 9) * (60 * 10 ** 9)
+        customer = _weighted(rng, activity, n_inv)
+        anonymous = rng.random(n_inv) < ANONYMOUS_SHARE
+        customer_id = np.where(anonymous, np.nan, people.CustomerID.to_numpy()[customer])
+        country = np.where(anonymous, countries[_weighted(rng, country_p, n_inv)],
+                           people.Country.to_numpy()[customer])
+
+        # Lines.
+        inv = np.repeat(np.arange(n_inv), lines)
+        is_cancelled = cancelled[inv]
+        odd = rng.random(n_unique) < PECULIAR_SHARE
+        product = _weighted(rng, popularity, n_unique)
+        odd_code = _weighted(rng, peculiar_p, n_unique)
+        stock = np.where(odd, peculiar.StockCode.to_numpy()[odd_code], products.StockCode.to_numpy()[product])
+        desc = np.where(odd, peculiar.Description.to_numpy()[odd_code], products.Description.to_numpy()[product])
+        price = np.where(odd, peculiar.UnitPrice.to_numpy()[odd_code], products.UnitPrice.to_numpy()[product])
+        quantity = rng.choice([1, 2, 3, 4, 6, 8, 10, 12, 24, 48], n_unique,
+                              p=[.3, .15, .1, .08, .12, .05, .05, .1, .04, .01])
+        quantity = np.where(is_cancelled, -quantity, quantity)
+
+        chunk = pd.DataFrame({
+            'InvoiceNo': np.where(is_cancelled, np.char.add('C', invoice_no[inv].astype(str)), invoice_no[inv].astype(str)),
+            'StockCode': stock,
+            'Description': desc,
+            'Quantity': quantity.astype('int64'),
+            'InvoiceDate': pd.to_datetime(dates[inv]),
+            'UnitPrice': price,
+            'CustomerID': customer_id[inv],
+            'Country': country[inv],
+        })
+        dup = np.sort(rng.choice(n_unique, n - n_unique, replace=False))
+        order = np.sort(np.concatenate([np.arange(n_unique), dup]), kind='stable')
+        yield chunk.iloc[order].reset_index(drop=True)[COLUMNS]
+
+
+def write(path, rows, seed=0, chunk_rows=1000000, **kwargs):
+    """Write a synthetic table of ``rows`` rows to a Parquet file, chunk by chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in generate(rows, seed=seed, chunk_rows=chunk_rows, **kwargs):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='retail_segmentation.synthetic',
+                                     description='Write synthetic Online Retail transactions.')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('path', help='output Parquet file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=1000000)
+    args = parser.parse_args(argv)
+    write(args.path, args.rows, seed=args.seed, chunk_rows=args.chunk_rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
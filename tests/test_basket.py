@@ -0,0 +1,21 @@
+import numpy as np
+
+from retail_segmentation import basket, synthetic
+
+
+def test_matrix_matches_pivot_table():
+    df = next(synthetic.generate(30000, seed=2)).dropna(subset=['CustomerID'])
+    X, customers, stock_codes = basket.matrix(df, chunk_rows=7000)
+    sales = df[df.Quantity > 0]
+    pivot = sales.pivot_table(index='CustomerID', columns='StockCode', values='Quantity', aggfunc='sum',
+                              fill_value=0, observed=True)
+    assert list(customers) == list(pivot.index)
+    dense = X.toarray()[:, stock_codes.get_indexer(pivot.columns)]
+    np.testing.assert_array_equal(dense, pivot.to_numpy())
+    assert X.nnz == (pivot.to_numpy() != 0).sum()
+
+
+def test_matrix_of_no_purchases_is_empty():
+    df = next(synthetic.generate(1000, seed=2))
+    X, customers, _ = basket.matrix(df[df.Quantity < 0], customers=[12346.0])
+    assert X.shape[0] == 1 and X.nnz == 0
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+from retail_segmentation import classify, pipeline, report
+
+
+@pytest.mark.parametrize('code, kind', sorted(classify.RULES.items()))
+def test_rules_win_over_the_cancellation_flag(code, kind):
+    kinds = classify.kinds(pd.Series([code] * 4), [False, False, True, True], [1, -1, 1, -1])
+    assert list(kinds) == [kind] * 4
+
+
+def test_products_are_sales_cancellations_or_adjustments():
+    kinds = classify.kinds(pd.Series(['85123A', '85123A', '85123A', '22423']), [False, True, True, False], [6, -6, 2, 0])
+    assert list(kinds) == ['sale', 'cancellation', 'cancellation', 'adjustment']
+    assert list(kinds.categories) == classify.KINDS
+
+
+def test_cancelled_invoices():
+    assert list(classify.cancelled(pd.Series(['536365', 'C536379', '536365', 'C536383']))) == [False, True, False, True]
+
+
+def test_unknown_kind_raises_value_error():
+    with pytest.raises(ValueError, match='refund'):
+        classify.kinds(pd.Series(['X']), [False], [1], rules={'X': 'refund'})
+
+
+def test_report_filters_the_same_sales_with_and_without_kind():
+    codes = list(classify.RULES) + ['85123A', '22423']
+    df = pd.DataFrame({'InvoiceNo': ['536365', 'C536379'] * len(codes),
+                       'StockCode': [code for code in codes for _ in range(2)],
+                       'Quantity': [3, -3] * len(codes)})
+    assert pipeline.CODES == list(classify.RULES)
+    plain = report.sales(df)
+    assert (report.sales(classify.classify(df.copy())) == plain).all()
+    assert list(df.StockCode[plain]) == ['85123A', '22423']
@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+import pytest
+
+from retail_segmentation import clustering, pipeline, synthetic
+
+
+def _memory_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def test_memory_budget_streams_the_normalized_customers_from_a_memory_map(tmp_path):
+    source = synthetic.write(os.path.join(str(tmp_path), 'retail.parquet'), 50000, seed=4)
+    results = [pipeline.run(source, k_values=(4,), compact=compact, kmeans='coreset', cache_dir=str(tmp_path))
+               for compact in (False, True)]
+    in_memory, streamed = (np.asarray(r['data_norm']) for r in results)
+    assert not _memory_mapped(in_memory)
+    assert _memory_mapped(streamed)
+    np.testing.assert_allclose(streamed, in_memory, atol=1e-12)
+    np.testing.assert_array_equal(results[1]['rfm'].Cluster_k4, results[0]['rfm'].Cluster_k4)
+
+
+@pytest.mark.parametrize('value', [0.0, 3.7])
+def test_coreset_of_identical_rows_is_drawn_uniformly(value):
+    points, weights = clustering.coreset(np.full((5000, 3), value), size=100, chunk_rows=700)
+    assert (points == value).all()
+    np.testing.assert_allclose(weights, 50.0)
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from retail_segmentation import cohort, synthetic
+
+
+@pytest.fixture(scope='module')
+def transactions():
+    df = next(synthetic.generate(60000, seed=7)).dropna(subset=['CustomerID'])
+    return df.assign(Month=df.InvoiceDate.dt.to_period('M'))
+
+
+def test_monthly_updates_match_a_full_rebuild(transactions, tmp_path):
+    path = os.path.join(str(tmp_path), 'cohorts.npz')
+    state = cohort.CohortState()
+    for month in sorted(transactions.Month.unique()):
+        batch = transactions[transactions.Month == month]
+        state.update(batch.CustomerID, batch.InvoiceDate)
+        history = transactions[transactions.Month <= month]
+        assert cohort.matches_rebuild(state, history)
+        state.save(path)
+        state = cohort.CohortState.load(path)
+        assert cohort.matches_rebuild(state, history)
+    assert not cohort.matches_rebuild(state, transactions[transactions.Month > transactions.Month.min()])
+
+
+def test_month_before_the_state_raises(transactions):
+    months = sorted(transactions.Month.unique())
+    state = cohort.CohortState.from_transactions(transactions[transactions.Month > months[0]])
+    early = transactions[transactions.Month == months[0]]
+    with pytest.raises(ValueError):
+        state.update(early.CustomerID, early.InvoiceDate)
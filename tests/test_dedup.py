@@ -0,0 +1,41 @@
+import os
+
+import pandas as pd
+
+from retail_segmentation import dedup, pipeline, synthetic
+
+
+def test_index_drops_lines_of_earlier_batches(tmp_path):
+    lines = dedup.drop_duplicates(pipeline.prepare(next(synthetic.generate(20000, seed=8))))[0]
+    first, new = lines.iloc[:12000], lines.iloc[12000:]
+    repeated = first.sample(500, random_state=0)
+    path = os.path.join(str(tmp_path), 'seen.npz')
+
+    index = dedup.FingerprintIndex()
+    dedup.drop_duplicates(first, index)
+    index.save(path)
+
+    # Only the saved fingerprints of the first batch are consulted, not its lines.
+    index = dedup.FingerprintIndex.load(path)
+    batch = pd.concat([new, repeated, repeated.iloc[:10]], ignore_index=True)
+    kept, counts = dedup.drop_duplicates(batch, index)
+    assert counts == (10, 500)
+    pd.testing.assert_frame_equal(kept, new.reset_index(drop=True))
+    assert index.rows == len(lines) + 510 and index.duplicates == 510
+    assert index.contains(dedup.fingerprint(kept)).all()
+
+
+def test_run_drops_the_lines_of_earlier_runs(tmp_path):
+    df = next(synthetic.generate(20000, seed=9))
+    first, second = df.iloc[:12000], pd.concat([df.iloc[12000:], df.iloc[:3000]])
+    paths = [os.path.join(str(tmp_path), name) for name in ('first.csv', 'second.csv')]
+    first.to_csv(paths[0], index=False)
+    second.to_csv(paths[1], index=False)
+    index = os.path.join(str(tmp_path), 'seen.npz')
+    runs = [pipeline.run(path, k_values=(3,), dedup_index=index, cache_dir=str(tmp_path / 'cache')) for path in paths]
+    dedup_stage = [r for r in runs[1]['run_report'].records if r['stage'] == 'dedup'][0]
+    repeated = second.iloc[-3000:].dropna(subset=['CustomerID'])
+    assert dedup_stage['duplicates'] >= len(repeated.drop_duplicates())
+    assert dedup_stage['rows_in'] - dedup_stage['rows_out'] == dedup_stage['duplicates']
+    assert len(runs[0]['transactions']) + len(runs[1]['transactions']) == \
+        len(pipeline.clean(pd.concat([first, second])))
@@ -0,0 +1,19 @@
+import csv
+
+from retail_segmentation.instrument import RunReport
+
+
+def test_csv_keeps_the_optional_stage_fields(tmp_path):
+    report = RunReport()
+    with report.stage('dedup', 10) as s:
+        s['rows_out'] = 8
+        s['duplicates'] = 2
+    with report.stage('rfm') as s:
+        s['rows_out'] = 4
+        s['cached'] = True
+    path = str(tmp_path / 'run.csv')
+    report.write(path)
+    with open(path) as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]['duplicates'] == '2'
+    assert rows[1]['cached'] == 'True'
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from retail_segmentation import netting
+
+
+def _naive(df):
+    """Line-by-line FIFO: every cancellation, oldest first, takes the oldest units bought at or before it."""
+    taken = np.zeros(len(df), dtype='int64')
+    unmatched = np.zeros(len(df), dtype='int64')
+    cancelled = df.InvoiceNo.str.startswith('C').to_numpy()
+    for _, lines in df.groupby(netting.KEY, sort=False):
+        lines = lines.sort_values('InvoiceDate', kind='stable')
+        purchases = [i for i in lines.index if not cancelled[i] and df.Quantity[i] > 0]
+        for j in lines.index[cancelled[lines.index]]:
+            wanted = -df.Quantity[j]
+            for i in purchases:
+                if df.InvoiceDate[i] > df.InvoiceDate[j] or not wanted:
+                    break
+                take = min(wanted, df.Quantity[i] - taken[i])
+                taken[i] += take
+                wanted -= take
+            unmatched[j] = wanted
+    return taken, unmatched
+
+
+def _lines(seed, n=300):
+    rng = np.random.default_rng(seed)
+    cancelled = rng.random(n) < 0.35
+    quantity = rng.integers(1, 8, n)
+    return pd.DataFrame({
+        'InvoiceNo': np.where(cancelled, 'C', '') + rng.integers(536000, 537000, n).astype(str),
+        'CustomerID': rng.integers(0, 4, n).astype(float),
+        'StockCode': rng.choice(['85123A', '22423', '47566'], n),
+        'UnitPrice': rng.choice([1.25, 2.95], n),
+        'Quantity': np.where(cancelled, -quantity, quantity),
+        'InvoiceDate': pd.Timestamp('2011-01-01') + pd.to_timedelta(rng.integers(0, 20, n), unit='D'),
+    })
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_match_equals_a_naive_fifo(seed):
+    df = _lines(seed)
+    taken, unmatched = netting.match(df)
+    expected = _naive(df)
+    np.testing.assert_array_equal(taken, expected[0])
+    np.testing.assert_array_equal(unmatched, expected[1])
+    # The random lines hit every case: partial takes, fully and partly unmatched cancellations.
+    purchases = ~df.InvoiceNo.str.startswith('C').to_numpy()
+    missing = unmatched[~purchases]
+    assert ((taken > 0) & (taken < df.Quantity)).any()
+    assert (missing == -df.Quantity[~purchases]).any() and ((missing > 0) & (missing < -df.Quantity[~purchases])).any()
+
+
+def test_cancellation_before_any_purchase_stays_unmatched():
+    df = pd.DataFrame({'InvoiceNo': ['C536379', '536380', 'C536381', 'C536382'],
+                       'CustomerID': 12346.0, 'StockCode': '85123A', 'UnitPrice': 2.95,
+                       'Quantity': [-4, 6, -2, -5],
+                       'InvoiceDate': pd.to_datetime(['2011-01-01', '2011-01-02', '2011-01-02', '2011-01-03'])})
+    taken, unmatched = netting.match(df)
+    assert list(taken) == [0, 6, 0, 0]
+    assert list(unmatched) == [4, 0, 0, 1]
+    df, counts = netting.net(df)
+    assert list(df.NetQuantity) == [-4, 0, 0, -1]
+    assert counts == {'cancellations': 3, 'unmatched': 1, 'partial': 1}
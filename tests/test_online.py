@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from retail_segmentation import online, pipeline
+from retail_segmentation.rfm import RFM_COLUMNS
+
+PROFILES = np.array([[200, 5, 80], [120, 120, 2500], [30, 30, 500], [15, 700, 15000]], dtype='float64')
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    rng = np.random.default_rng(0)
+    group = rng.integers(0, len(PROFILES), 4000)
+    data = pd.DataFrame(np.exp(np.log(PROFILES[group]) + rng.normal(0, 0.3, (4000, 3))), columns=RFM_COLUMNS)
+    scaler, data_norm = pipeline.scale(data)
+    state = online.SegmentState.from_fitted(scaler, pipeline.cluster(data_norm, 4))
+    return data, scaler, data_norm, state
+
+
+def test_align_keeps_the_ids_of_a_permuted_refit(fitted):
+    data, scaler, data_norm, previous = fitted
+    order = np.array([2, 0, 3, 1])
+    refit = online.SegmentState.from_fitted(scaler, pipeline.cluster(data_norm, 4, random_state=7)).reorder(order)
+    assert (refit.labels_ != previous.labels_).any()
+    aligned, mapping = online.align(previous, refit)
+    np.testing.assert_array_equal(aligned.labels_, previous.labels_)
+    np.testing.assert_allclose(aligned.centroids, previous.centroids, rtol=1e-6)
+    np.testing.assert_array_equal(mapping[refit.labels_], aligned.labels_)
+    assert not online.needs_retrain(online.drift(previous, aligned))
+
+
+def test_align_rejects_another_k(fitted):
+    _, scaler, data_norm, previous = fitted
+    with pytest.raises(ValueError):
+        online.align(previous, online.SegmentState.from_fitted(scaler, pipeline.cluster(data_norm, 3)))
+
+
+@pytest.mark.parametrize('shift, size_change, retrain', [
+    (online.MAX_SHIFT * 0.99, 0.0, False),
+    (online.MAX_SHIFT * 1.01, 0.0, True),
+    (0.0, online.MAX_SIZE_CHANGE * 0.99, False),
+    (0.0, online.MAX_SIZE_CHANGE * 1.01, True),
+    (0.0, -online.MAX_SIZE_CHANGE * 1.01, True),
+    (0.0, -1.0, True),
+])
+def test_needs_retrain_thresholds(shift, size_change, retrain):
+    report = pd.DataFrame({'shift': [0.0, shift], 'previous_size': [10, 10], 'size': [10, 10],
+                           'size_change': [0.0, size_change]})
+    assert online.needs_retrain(report) is retrain
+
+
+def test_partial_fit_of_the_same_snapshot_does_not_drift(fitted):
+    data, _, _, previous = fitted
+    state = previous.copy()
+    labels = state.partial_fit(data)
+    np.testing.assert_array_equal(labels, previous.labels_)
+    report = online.drift(previous, state)
+    assert not online.needs_retrain(report)
+    np.testing.assert_allclose(report.size_change, 0.0)
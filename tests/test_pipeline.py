@@ -0,0 +1,55 @@
+import os
+
+import pandas as pd
+import pytest
+
+from retail_segmentation import pipeline, synthetic
+from retail_segmentation.__main__ import write_tables
+
+
+def _source(tmp_path):
+    """Synthetic transactions plus copies of some lines that only differ in their Description."""
+    df = next(synthetic.generate(20000, seed=1))
+    copies = df[df.CustomerID.notna()].iloc[::50].copy()
+    copies['Description'] = copies.Description + ' (RENAMED)'
+    path = os.path.join(str(tmp_path), 'retail.csv')
+    pd.concat([df, copies]).sort_values('InvoiceDate', kind='stable').to_csv(path, index=False)
+    return path
+
+
+def test_report_does_not_change_customers(tmp_path):
+    source = _source(tmp_path)
+    for report in (False, True):
+        result = pipeline.run(source, k_values=(3,), report=report, cache_dir=str(tmp_path / 'cache'))
+        write_tables(result, str(tmp_path / 'report-{}'.format(report)))
+    with open(tmp_path / 'report-False' / 'customers.csv') as a, open(tmp_path / 'report-True' / 'customers.csv') as b:
+        assert a.read() == b.read()
+
+
+@pytest.mark.parametrize('kmeans', ['exact', 'minibatch'])
+def test_single_country_partition_matches_the_whole_run(tmp_path, kmeans):
+    df = next(synthetic.generate(40000, seed=3))
+    source = os.path.join(str(tmp_path), 'uk.csv')
+    df[df.Country == 'United Kingdom'].to_csv(source, index=False)
+    result = pipeline.run(source, k_values=(3,), countries=True, bins=[0, 6, 9, 13], labels=['Low', 'Mid', 'High'],
+                          cache_dir=str(tmp_path / 'cache'), n_jobs=1, kmeans=kmeans)
+    whole = result['rfm'].reset_index(drop=True)
+    country = result['country_rfm'].set_index('CustomerID').loc[whole.CustomerID].reset_index()
+    pd.testing.assert_frame_equal(country[whole.columns], whole, check_dtype=False)
+
+
+def test_states_fold_batches_into_the_results_of_the_whole(tmp_path):
+    df = next(synthetic.generate(40000, seed=6))
+    paths = [os.path.join(str(tmp_path), name) for name in ('whole.csv', 'first.csv', 'second.csv')]
+    split = df.InvoiceDate >= '2011-08-01'
+    for path, part in zip(paths, [df, df[~split], df[split]]):
+        part.to_csv(path, index=False)
+    states = {'rfm_state': os.path.join(str(tmp_path), 'rfm.npz'),
+              'cohort_state': os.path.join(str(tmp_path), 'cohorts.npz')}
+    for path in paths[1:]:
+        batches = pipeline.run(path, k_values=(3,), cache_dir=str(tmp_path / 'cache'), **states)
+    whole = pipeline.run(paths[0], k_values=(3,), cache_dir=str(tmp_path / 'cache'))
+    pd.testing.assert_frame_equal(batches['rfm'].drop(columns='Cluster_k3'), whole['rfm'].drop(columns='Cluster_k3'),
+                                  check_dtype=False, check_categorical=False, rtol=1e-9)
+    pd.testing.assert_frame_equal(batches['cohort_counts'], whole['cohort_counts'], check_dtype=False,
+                                  check_index_type=False, check_column_type=False)
@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+import pytest
+
+from retail_segmentation import rfm, synthetic
+
+WINDOW_DAYS = 90
+
+
+@pytest.fixture(scope='module')
+def transactions():
+    df = next(synthetic.generate(60000, seed=5)).dropna(subset=['CustomerID'])
+    df = df.assign(InvoiceDate=df.InvoiceDate.dt.normalize(), Amount=df.Quantity * df.UnitPrice)
+    return df.reset_index(drop=True)
+
+
+def _assert_same(state_frame, expected):
+    pd.testing.assert_frame_equal(state_frame.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False, rtol=1e-9)
+
+
+def test_state_frame_matches_compute_after_updates_and_advances(transactions, tmp_path):
+    path = os.path.join(str(tmp_path), 'rfm.npz')
+    months = transactions.InvoiceDate.dt.to_period('M')
+    state = rfm.RFMState(WINDOW_DAYS)
+    for month in months.unique():
+        state.update(transactions[months == month])
+        state.save(path)
+        state = rfm.RFMState.load(path)
+        history = transactions[(months <= month) & (transactions.Amount > 0)]
+        _assert_same(state.frame(), rfm.compute(history, window_days=WINDOW_DAYS))
+
+    last = history.InvoiceDate.max()
+    for days in (10, 45):
+        end = last + pd.Timedelta(days=days)
+        expected = rfm.compute(history, window_days=WINDOW_DAYS, end=end)
+        _assert_same(state.frame(snapshot_date=end + pd.Timedelta(days=1)), expected)
+        state.advance(end)
+        state.save(path)
+        _assert_same(rfm.RFMState.load(path).frame(), expected)
+
+
+def test_state_frame_has_no_earlier_snapshot(transactions):
+    state = rfm.RFMState.from_transactions(transactions, WINDOW_DAYS)
+    with pytest.raises(ValueError):
+        state.frame(snapshot_date=transactions.InvoiceDate.max() - pd.Timedelta(days=3))
+    _assert_same(state.frame(snapshot_date=state.snapshot_date), state.frame())
+
+
+def test_rolling_matches_compute_at_every_snapshot(transactions):
+    snapshots = rfm.month_snapshots(transactions.InvoiceDate, months=6)
+    table = rfm.rolling(transactions, snapshots, window_days=WINDOW_DAYS)
+    assert sorted(table.snapshot.unique()) == list(snapshots)
+    for snapshot in snapshots:
+        history = transactions[transactions.InvoiceDate < snapshot]
+        expected = rfm.compute(history, window_days=WINDOW_DAYS, end=snapshot - pd.Timedelta(days=1))
+        _assert_same(table[table.snapshot == snapshot].drop(columns='snapshot'), expected)
@@ -0,0 +1,46 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from retail_segmentation.serving import SegmentModel, serve
+
+
+@pytest.fixture
+def model():
+    return SegmentModel(mean=[3.0, 2.0, 6.0], scale=[1.0, 1.0, 1.0],
+                        centroids=[[-1.0, -1.0, -1.0], [0.0, 0.0, 0.0], [1.0, 1.0, 1.0]])
+
+
+def test_predict(model):
+    rows = np.exp([[2.0, 1.0, 5.0], [3.0, 2.0, 6.0], [4.0, 3.0, 7.0]])
+    assert model.predict(rows).tolist() == [0, 1, 2]
+
+
+@pytest.mark.parametrize('row', [[0, 5, 10.0], [12, 5, -10.0], [np.nan, 1, 1], [1, np.inf, 1]])
+def test_predict_rejects_non_positive_and_missing_values(model, row):
+    with pytest.raises(ValueError, match='finite and positive'):
+        model.predict([[12, 5, 830.5], row])
+
+
+def test_service_answers_400_on_invalid_rows(model):
+    server = serve(model, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = 'http://{}:{}/predict'.format(*server.server_address)
+    try:
+        body = json.dumps({'rows': [[12, 5, 830.5]]}).encode()
+        with urllib.request.urlopen(urllib.request.Request(url, body)) as response:
+            assert len(json.loads(response.read())['clusters']) == 1
+
+        body = json.dumps({'rows': [[0, 5, -10.0]]}).encode()
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(urllib.request.Request(url, body))
+        assert e.value.code == 400
+        assert 'finite and positive' in json.loads(e.value.read())['error']
+    finally:
+        server.shutdown()
+        server.server_close()
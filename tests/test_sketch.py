@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from retail_segmentation.sketch import QuantileSketch
+
+
+def test_quantiles_within_the_rank_error():
+    values = np.random.default_rng(0).lognormal(size=200000)
+    sketch = QuantileSketch.from_values(values)
+    for q, cut in zip((0.25, 0.5, 0.75), sketch.quantile((0.25, 0.5, 0.75))):
+        assert abs((values <= cut).mean() - q) < 0.01
+    assert sketch.quantile(0) == values.min() and sketch.quantile(1) == values.max()
+
+
+@pytest.mark.parametrize('values', [[], [np.nan, np.nan]])
+def test_empty_sketch_raises_value_error(values):
+    sketch = QuantileSketch.from_values(values)
+    with pytest.raises(ValueError, match='empty'):
+        sketch.quantile(0.5)
+    with pytest.raises(ValueError, match='empty'):
+        sketch.rank(1.0)
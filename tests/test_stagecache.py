@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from retail_segmentation import pipeline, stagecache, synthetic
+from retail_segmentation.rfm import SEGMENT_BINS, SEGMENT_LABELS
+
+
+def _keys(source, tmp_path, window_days=365, bins=SEGMENT_BINS):
+    return pipeline._stage_keys(source, str(tmp_path / 'cache'), False, False, False, window_days, 'Amount', False,
+                                bins, SEGMENT_LABELS)
+
+
+def test_inputs_and_parameters_change_the_keys(tmp_path):
+    source = os.path.join(str(tmp_path), 'retail.csv')
+    df = next(synthetic.generate(2000, seed=4))
+    df.to_csv(source, index=False)
+    keys = _keys(source, tmp_path)
+    assert _keys(source, tmp_path) == keys
+
+    # A parameter only changes the keys downstream of it.
+    window = _keys(source, tmp_path, window_days=180)
+    assert window['cohort'] == keys['cohort'] and window['values'] != keys['values'] and window['rfm'] != keys['rfm']
+    bins = _keys(source, tmp_path, bins=[0, 6, 9, 13])
+    assert bins['values'] == keys['values'] and bins['rfm'] != keys['rfm']
+
+    df.iloc[:-1].to_csv(source, index=False)
+    changed = _keys(source, tmp_path)
+    assert all(changed[name] != keys[name] for name in keys)
+    assert stagecache.key('cluster', keys['rfm'], 3) != stagecache.key('cluster', keys['rfm'], 4)
+
+
+def test_hit_returns_the_stored_results(tmp_path):
+    cache = stagecache.StageCache(str(tmp_path))
+    frame = pd.DataFrame({'CustomerID': [12346.0, 12347.0], 'Segment': ['Low', 'High']})
+    results = {'rfm': frame, 'labels': np.array([0, 2]), 'sizes': {'Low': 1, 'High': 1}}
+    assert cache.get('rfm', 'abc') is None and ('rfm', 'abc') not in cache
+    cache.put('rfm', 'abc', results)
+    assert ('rfm', 'abc') in cache and cache.get('rfm', 'abd') is None
+    hit = cache.get('rfm', 'abc')
+    pd.testing.assert_frame_equal(hit['rfm'], frame)
+    np.testing.assert_array_equal(hit['labels'], results['labels'])
+    assert hit['sizes'] == results['sizes']
+    assert list(cache.get('rfm', 'abc', names=['labels'])) == ['labels']
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    values = np.zeros(1000)
+    cache = stagecache.StageCache(str(tmp_path))
+    cache.put('stage', 'a', {'values': values})
+    size = cache.size()
+    cache = stagecache.StageCache(str(tmp_path), max_mb=3.5 * size / 2 ** 20)
+    for name in 'bc':
+        cache.put('stage', name, {'values': values})
+    cache.get('stage', 'a')
+    cache.put('stage', 'd', {'values': values})
+    assert [name for name in 'abcd' if ('stage', name) in cache] == ['a', 'c', 'd']
+    assert not os.path.exists(os.path.join(str(tmp_path), 'stage-b'))
+    assert cache.size() == 3 * size
+
+    # An entry larger than the limit is still kept; every other one goes.
+    cache.put('stage', 'e', {'values': np.zeros(4000)})
+    assert [name for name in 'acde' if ('stage', name) in cache] == ['e']